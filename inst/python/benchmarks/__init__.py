@@ -0,0 +1,7 @@
+"""
+Benchmarks of the loneliness pipelines, run offline on synthetic data.
+
+synthetic.py writes prescribing files, GP details, a postcode table and zone boundaries in the layout of the real
+downloads at a chosen scale; suite.py times the pipeline functions on them and compares each run with saved runs.
+Run from inst/python/ with python -m benchmarks; it exits with 1 if a benchmark regressed.
+"""
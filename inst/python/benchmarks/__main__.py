@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+from .synthetic import SCALES, URL_SETTINGS, generate, serve, served_settings
+from .suite import (
+    HISTORY_PATH,
+    THRESHOLD,
+    benchmark_nation,
+    find_regressions,
+    read_history,
+    run_record,
+    save_record,
+)
+
+
+def parse_args(argv=None):
+    """
+    Parses the command line of the benchmark suite.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Times the loneliness pipelines offline on synthetic data and checks for regressions.",
+    )
+    parser.add_argument(
+        "nations",
+        nargs="*",
+        default=["scotland", "wales", "ni"],
+        help="nations to benchmark (default: scotland wales ni)",
+    )
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--repeat", type=int, default=3, help="calls per benchmark")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="processes used by count_condition"
+    )
+    parser.add_argument(
+        "--data",
+        metavar="DIR",
+        help="keep the synthetic data in DIR, reusing it if already generated (default: a temporary folder)",
+    )
+    parser.add_argument("--history", default=HISTORY_PATH, help="saved runs")
+    parser.add_argument(
+        "--save", action="store_true", help="append this run to the history"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help="fraction slower than recent runs that fails a benchmark",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Generates synthetic data, times each benchmark per nation, then compares the run with the history.
+    Returns 1 if a benchmark regressed, otherwise 0.
+    """
+    args = parse_args(argv)
+    if "loneliness.paths" in sys.modules:
+        raise RuntimeError(
+            "Benchmarks must set LONELINESS_EXTDATA before loneliness is imported"
+        )
+    data = args.data or tempfile.mkdtemp(prefix="loneliness_benchmarks_")
+    extdata = os.path.join(data, f"{args.scale}_extdata")
+    os.environ["LONELINESS_EXTDATA"] = extdata
+
+    from loneliness.nations import NATIONS
+    from loneliness.plotting import set_plot_mode
+
+    set_plot_mode("off")
+    # Settings pointing each nation at its synthetic files, kept with the data so --data can reuse it
+    settings = {}
+    settings_path = os.path.join(extdata, "settings.json")
+    if os.path.exists(settings_path):
+        with open(settings_path) as settings_file:
+            settings = json.load(settings_file)
+    # Data generated when urls were file:// urls is generated again
+    relative = all(
+        "://" not in json.dumps([nation_settings.get(key) for key in URL_SETTINGS])
+        for nation_settings in settings.values()
+    )
+    if set(args.nations) <= set(settings) and relative:
+        print(f"Using synthetic data in {extdata}")
+    else:
+        print(f"Generating {args.scale} synthetic data in {extdata}")
+        settings = generate(extdata, args.scale, args.nations)
+        with open(settings_path, "w") as settings_file:
+            json.dump(settings, settings_file, indent=2)
+
+    results = {}
+    try:
+        # The downloads are served locally, so timings include the checks the downloader makes on every run
+        with serve(extdata) as base_url:
+            for nation in args.nations:
+                NATIONS[nation].update(served_settings(settings[nation], base_url))
+                print(f"Benchmarking {nation}...")
+                for name, result in benchmark_nation(
+                    nation, args.repeat, args.workers
+                ).items():
+                    results[f"{nation}/{name}"] = result
+                    print(
+                        f" {name}: best {result['best']:.3f}s, median {result['median']:.3f}s"
+                    )
+    finally:
+        if args.data is None:
+            shutil.rmtree(data, ignore_errors=True)
+
+    record = run_record(results, args.scale, args.repeat, args.workers)
+    regressions = find_regressions(record, read_history(args.history), args.threshold)
+    for name, best, baseline in regressions:
+        print(f"Regression: {name} took {best:.3f}s, against {baseline:.3f}s before")
+    if args.save:
+        save_record(record, args.history)
+        print(f"Run saved to {args.history}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+import io
+import os
+import json
+import shutil
+import platform
+import statistics
+import subprocess
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+# Timings of the pipeline functions on synthetic data from synthetic.py, compared with earlier runs to catch regressions
+# Functions are imported from loneliness on first use, after the caller has pointed LONELINESS_EXTDATA at the data
+
+# Results of earlier runs saved with --save, one JSON line per run
+HISTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.jsonl")
+
+# A benchmark regresses when its best time is this fraction slower than the best of recent runs with the same config
+THRESHOLD = 0.25
+
+# Slow downs smaller than this many seconds are ignored, as timer noise dominates the fastest benchmarks
+MIN_REGRESSION_SECONDS = 0.05
+
+# Number of recent runs with the same config that the baseline is taken from
+BASELINE_RUNS = 5
+
+# Fields of a run record that must match for earlier runs to be its baseline
+RUN_CONFIG = ["scale", "host", "repeat", "workers"]
+
+
+def time_call(function, setup=None, repeat=3):
+    """
+    Calls function repeat times, after setup each time if given, with its printed output discarded.
+    Returns the times in seconds and the result of the last call.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = function()
+            times.append(time.perf_counter() - start)
+    return times, result
+
+
+def summarise_times(times):
+    """
+    Returns the best and median of a benchmark's times, rounded to the millisecond.
+    """
+    return {
+        "best": round(min(times), 3),
+        "median": round(statistics.median(times), 3),
+    }
+
+
+def read_month(nation, path):
+    """
+    Reads the description and items of a synthetic prescribing file, as count_partition() hands them to code_condition().
+    """
+    import zipfile
+    import pandas as pd
+    from loneliness.nations import nation_config, prescribing_column
+
+    config = nation_config(nation)
+    columns = [
+        prescribing_column(nation, "description"),
+        prescribing_column(nation, "items"),
+    ]
+    dtypes = {column: config["prescribing_dtypes"][column] for column in columns}
+    if config["zip_members"] is None:
+        return pd.read_csv(path, usecols=columns, dtype=dtypes, **config["read_kwargs"])
+    with zipfile.ZipFile(path) as zip_file:
+        member = next(
+            name
+            for name in zip_file.namelist()
+            if config["zip_members"]["prescribing"] in name
+        )
+        with zip_file.open(member) as csv_file:
+            return pd.read_csv(csv_file, usecols=columns, dtype=dtypes)
+
+
+def benchmark_nation(nation, repeat=3, workers=1):
+    """
+    Times code_condition, count_condition, add_postcode (subset_gps for wales), find_best_params, predict_scores
+    and zonal_statistics on a nation's synthetic data, in pipeline order, each output feeding the next.
+    Caches are cleared before each call, so code_condition, count_condition and zonal_statistics are timed cold:
+    classifying descriptions, converting months into the Parquet store and rasterising the zones.
+    Returns {benchmark: {"best": seconds, "median": seconds}}.
+    """
+    from urllib.parse import unquote
+    from loneliness import preproc, scoring
+    from loneliness.monthly_summaries import SUMMARY_PATH
+    from loneliness.nations import CONDITION_CACHE_FILE, nation_config
+    from loneliness.paths import extdata_path
+    from loneliness.prescribing_store import STORE_PATH
+    from loneliness.raster_prediction import raster_transform
+    from loneliness.zonal import LABEL_CACHE_PATH, zonal_statistics
+
+    config = nation_config(nation)
+    results = {}
+
+    def clear_matcher():
+        preproc._condition_matcher = None
+        if os.path.exists(extdata_path(CONDITION_CACHE_FILE)):
+            os.remove(extdata_path(CONDITION_CACHE_FILE))
+
+    def clear_months():
+        clear_matcher()
+        for path in [STORE_PATH, SUMMARY_PATH]:
+            shutil.rmtree(os.path.join(path, f"nation={nation}"), ignore_errors=True)
+
+    # Classify one month of descriptions
+    month = read_month(
+        nation,
+        extdata_path(
+            config["prescribing_folder"],
+            unquote(os.path.basename(config["prescribing_urls"][0])),
+        ),
+    )
+    times, _ = time_call(
+        lambda: preproc.code_condition(nation, month), clear_matcher, repeat
+    )
+    results["code_condition"] = summarise_times(times)
+
+    # Count a year of prescriptions from the raw files
+    times, monthly_prescriptions = time_call(
+        lambda: preproc.count_condition(nation, workers=workers), clear_months, repeat
+    )
+    results["count_condition"] = summarise_times(times)
+
+    # Join GP postcodes, or keep GP practices only for wales
+    add_postcode = (
+        preproc.subset_gps
+        if config["zip_members"] is not None
+        else preproc.add_postcode
+    )
+    times, monthly_prescriptions_postcodes = time_call(
+        lambda: add_postcode(nation, monthly_prescriptions.copy()), repeat=repeat
+    )
+    results["add_postcode"] = summarise_times(times)
+
+    with redirect_stdout(io.StringIO()):
+        gp_postcode = preproc.standardise(
+            nation,
+            preproc.illness_percentage(nation, monthly_prescriptions_postcodes),
+        )
+        gp_geo = scoring.create_gp_coordinate_geoframe(nation, gp_postcode)
+        zone_coords = scoring.load_zone_boundaries(nation)
+
+    # Tune the IDW model
+    times, best_params = time_call(
+        lambda: scoring.find_best_params(nation, gp_geo), repeat=repeat
+    )
+    results["find_best_params"] = summarise_times(times)
+
+    # Predict the grid inside the zone boundaries
+    xmin, ymax, shape = scoring.create_grid(gp_geo)
+    times, scores_reshaped = time_call(
+        lambda: scoring.predict_scores(
+            gp_geo, xmin, ymax, shape, best_params, mask=zone_coords["geometry"]
+        ),
+        repeat=repeat,
+    )
+    results["predict_scores"] = summarise_times(times)
+
+    # Average the grid per zone, rasterising the zones each time
+    times, _ = time_call(
+        lambda: zonal_statistics(
+            zone_coords["geometry"],
+            scores_reshaped,
+            raster_transform(xmin, ymax),
+            source=config["boundaries_url"],
+        ),
+        lambda: shutil.rmtree(LABEL_CACHE_PATH, ignore_errors=True),
+        repeat,
+    )
+    results["zonal_statistics"] = summarise_times(times)
+    return results
+
+
+def git_commit():
+    """
+    Returns the short hash of the checked out commit, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_record(results, scale, repeat, workers):
+    """
+    Returns the record of a benchmark run saved to the history: when, where and on which commit it ran, and its results.
+    """
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "scale": scale,
+        "repeat": repeat,
+        "workers": workers,
+        "results": results,
+    }
+
+
+def read_history(path=HISTORY_PATH):
+    """
+    Returns the saved benchmark runs, oldest first; empty if none have been saved.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path) as history_file:
+        return [json.loads(line) for line in history_file if line.strip()]
+
+
+def save_record(record, path=HISTORY_PATH):
+    """
+    Appends a benchmark run to the history.
+    """
+    with open(path, "a") as history_file:
+        history_file.write(json.dumps(record) + "\n")
+
+
+def find_regressions(record, history, threshold=THRESHOLD):
+    """
+    Compares each result of a run with the best time of the last BASELINE_RUNS saved runs with the same RUN_CONFIG:
+    the scale, host, calls per benchmark and workers.
+    Returns (benchmark, best time, baseline) for each benchmark slower than the baseline by more than threshold
+    and MIN_REGRESSION_SECONDS.
+    """
+    earlier = [
+        run for run in history if all(run.get(key) == record[key] for key in RUN_CONFIG)
+    ][-BASELINE_RUNS:]
+    regressions = []
+    for name, result in record["results"].items():
+        baselines = [
+            run["results"][name]["best"] for run in earlier if name in run["results"]
+        ]
+        if not baselines:
+            continue
+        baseline = min(baselines)
+        if (
+            result["best"] > baseline * (1 + threshold)
+            and result["best"] - baseline > MIN_REGRESSION_SECONDS
+        ):
+            regressions.append((name, result["best"], baseline))
+    return regressions
@@ -0,0 +1,327 @@
+import os
+import zipfile
+import threading
+from contextlib import contextmanager
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+
+# Synthetic inputs for the scotland, wales and ni pipelines, written in the layout and schemas of the real downloads
+# so the pipelines run offline: monthly prescribing files, GP details, a postcode table and zone boundaries
+
+# Sizes of the synthetic data; large is close to a year of Scotland's prescribing
+SCALES = {
+    "small": {
+        "practices": 100,
+        "rows": 20_000,
+        "months": 3,
+        "other_descriptions": 500,
+        "zones": 200,
+        "region_km": 60,
+    },
+    "medium": {
+        "practices": 500,
+        "rows": 200_000,
+        "months": 6,
+        "other_descriptions": 5_000,
+        "zones": 1_500,
+        "region_km": 150,
+    },
+    "large": {
+        "practices": 1_000,
+        "rows": 1_000_000,
+        "months": 12,
+        "other_descriptions": 20_000,
+        "zones": 7_000,
+        "region_km": 300,
+    },
+}
+
+# South west corner of each nation's synthetic region on the British National Grid, and its postcode area
+ORIGINS = {
+    "scotland": (200_000, 600_000, "EH"),
+    "wales": (250_000, 200_000, "CF"),
+    "ni": (300_000, 400_000, "BT"),
+}
+
+# Share of prescriptions for a medication in drug_list.csv
+LONELINESS_SHARE = 0.3
+
+# Practices in the prescribing files but not in the GP lists, e.g. pharmacies, per 10 GP practices
+NON_GP_PER_10 = 1
+
+LETTERS = "ABDEFGHJLNPQRSTUWXYZ"
+
+# Settings holding download urls, which generate() gives as paths relative to extdata for serve() to complete
+URL_SETTINGS = ["prescribing_urls", "gp_list_url", "gp_details_urls"]
+
+
+def practice_codes(nation, n):
+    """
+    Returns n practice codes in the nation's format: numbers for scotland and ni, strings for wales.
+    """
+    if nation == "wales":
+        return [f"W{i:05d}" for i in range(n)]
+    return list(range(10_001, 10_001 + n))
+
+
+def postcodes(area, n):
+    """
+    Returns n distinct postcodes in a postcode area, e.g. "EH1 0AA".
+    """
+    return [
+        f"{area}{1 + i // 400} {(i // 40) % 10}{LETTERS[(i // 20) % 2]}{LETTERS[i % 20]}"
+        for i in range(n)
+    ]
+
+
+def descriptions(drug_list, n_other):
+    """
+    Returns prescription descriptions for each medication in drug_list.csv at a few strengths,
+    and n_other descriptions of unrelated products.
+    """
+    loneliness = [
+        f"{medication.title()} {strength}mg tablets"
+        for medication in drug_list["medication"].unique()
+        for strength in (5, 10, 20)
+    ]
+    other = [f"Product {i} {5 * (1 + i % 8)}mg capsules" for i in range(n_other)]
+    return loneliness, other
+
+
+def prescribing_month(nation, practices, loneliness, other, rows, rng):
+    """
+    Returns one month of prescriptions in the nation's raw schema, with an unused column like the real files.
+    """
+    from loneliness.nations import nation_config
+
+    columns = {
+        normalised: raw
+        for raw, normalised in nation_config(nation)["prescribing_columns"].items()
+    }
+    is_loneliness = rng.random(rows) < LONELINESS_SHARE
+    description = np.where(
+        is_loneliness,
+        np.asarray(loneliness)[rng.integers(0, len(loneliness), rows)],
+        np.asarray(other)[rng.integers(0, len(other), rows)],
+    )
+    return pd.DataFrame(
+        {
+            columns["practice"]: np.asarray(practices)[
+                rng.integers(0, len(practices), rows)
+            ],
+            columns["description"]: description,
+            columns["items"]: rng.integers(1, 60, rows),
+            "PaidQuantity": rng.integers(1, 500, rows),
+        }
+    )
+
+
+def boundaries(nation, n_zones, region, rng):
+    """
+    Returns n_zones Voronoi polygons covering the nation's region, in the layout of the boundary store.
+    """
+    import geopandas as gpd
+    import shapely
+    from loneliness.boundary_store import BBOX_COLUMNS
+    from loneliness.nations import nation_config
+
+    x0, y0, _ = ORIGINS[nation]
+    seeds = shapely.multipoints(
+        np.column_stack(
+            [x0 + rng.uniform(0, region, n_zones), y0 + rng.uniform(0, region, n_zones)]
+        )
+    )
+    box = shapely.box(x0, y0, x0 + region, y0 + region)
+    polygons = shapely.intersection(
+        shapely.get_parts(shapely.voronoi_polygons(seeds, extend_to=box)), box
+    )
+    zones = gpd.GeoDataFrame(
+        {
+            nation_config(nation)["zone_code_column"]: [
+                f"Z{i:06d}" for i in range(n_zones)
+            ]
+        },
+        geometry=polygons,
+        crs="epsg:27700",
+    )
+    zones[BBOX_COLUMNS] = zones.bounds.to_numpy()
+    zones["simplified"] = zones.geometry.simplify(50, preserve_topology=True)
+    return zones
+
+
+def generate(extdata, scale="small", nations=("scotland", "wales", "ni"), seed=1):
+    """
+    Writes synthetic inputs for each nation into extdata, a folder laid out like inst/extdata/, at the given scale.
+    Files are named after the real downloads so the pipelines find them; the returned settings give each nation's
+    urls as the paths of the files relative to extdata, which served_settings() turns into urls served by serve().
+    Returns {nation: settings} to update NATIONS with.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from loneliness.boundary_store import boundary_path
+    from loneliness.nations import DRUG_LIST_FILE, nation_config
+    from loneliness.paths import REPO_PATH
+    from loneliness.postcode_lookup import (
+        POSTCODE_TABLE_PATH,
+        ROW_GROUP_SIZE,
+        normalise_postcodes,
+    )
+
+    sizes = SCALES[scale]
+    region = sizes["region_km"] * 1000
+    rng = np.random.default_rng(seed)
+    os.makedirs(extdata, exist_ok=True)
+
+    drug_list = pd.read_csv(os.path.join(REPO_PATH, "inst", "extdata", DRUG_LIST_FILE))
+    drug_list.to_csv(os.path.join(extdata, DRUG_LIST_FILE), index=False)
+    loneliness, other = descriptions(drug_list, sizes["other_descriptions"])
+
+    settings = {}
+    nspl = []
+    for nation in nations:
+        config = nation_config(nation)
+        x0, y0, area = ORIGINS[nation]
+        n_practices = sizes["practices"] * (10 + NON_GP_PER_10) // 10
+        practices = practice_codes(nation, n_practices)
+        gps = practices[: sizes["practices"]]
+        practice_postcodes = dict(zip(practices, postcodes(area, n_practices)))
+        nspl.append(
+            pd.DataFrame(
+                {
+                    "pcds": list(practice_postcodes.values()),
+                    "oseast1m": x0 + rng.integers(0, region, n_practices),
+                    "osnrth1m": y0 + rng.integers(0, region, n_practices),
+                }
+            )
+        )
+
+        # Monthly prescribing files, named after the latest months' urls
+        folder = os.path.join(extdata, config["prescribing_folder"])
+        os.makedirs(folder, exist_ok=True)
+        month_paths = []
+        for url in config["prescribing_urls"][: sizes["months"]]:
+            path = os.path.join(folder, os.path.basename(url))
+            month = prescribing_month(
+                nation, practices, loneliness, other, sizes["rows"], rng
+            )
+            if config["zip_members"] is not None:
+                address = pd.DataFrame(
+                    {
+                        config["address_practice_column"]: practices,
+                        "Postcode": [practice_postcodes[p] for p in practices],
+                    }
+                )
+                with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+                    zip_file.writestr(
+                        f"{config['zip_members']['prescribing']}.csv",
+                        month.to_csv(index=False),
+                    )
+                    zip_file.writestr(
+                        f"{config['zip_members']['address']}.csv",
+                        address.to_csv(index=False),
+                    )
+            else:
+                month.to_csv(path, index=False, **config["read_kwargs"])
+            month_paths.append(path)
+        settings[nation] = {
+            "prescribing_urls": [relative_url(extdata, path) for path in month_paths]
+        }
+
+        # GP details: a list of GP practices for wales, contact details with postcodes otherwise
+        folder = os.path.join(extdata, config["gp_details_folder"])
+        os.makedirs(folder, exist_ok=True)
+        if config["zip_members"] is not None:
+            path = os.path.join(folder, os.path.basename(config["gp_list_url"]))
+            practice = next(
+                raw
+                for raw, normalised in config["prescribing_columns"].items()
+                if normalised == "practice"
+            )
+            pd.DataFrame({practice: gps}).to_excel(path, index=False, engine="openpyxl")
+            settings[nation]["gp_list_url"] = relative_url(extdata, path)
+        else:
+            path = os.path.join(folder, os.path.basename(config["gp_details_urls"][0]))
+            pd.DataFrame(
+                {
+                    config["gp_details_practice_column"]: gps,
+                    "Postcode": [practice_postcodes[p] for p in gps],
+                }
+            ).to_csv(path, index=False)
+            settings[nation]["gp_details_urls"] = [relative_url(extdata, path)]
+
+        # Zone boundaries, stored under the key the pipeline looks them up by
+        path = boundary_path(
+            config["boundaries_url"],
+            config["boundaries_crs"],
+            50,
+            os.path.join(extdata, "boundaries"),
+        )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        boundaries(nation, sizes["zones"], region, rng).to_parquet(path, index=False)
+        settings[nation]["expected_zones"] = None
+
+    # Postcode table in the layout of postcode_lookup.py
+    nspl = pd.concat(nspl, ignore_index=True)
+    nspl["pcds"] = normalise_postcodes(nspl["pcds"])
+    nspl = nspl.astype({"oseast1m": "Int32", "osnrth1m": "Int32"})
+    nspl["lsoa11"] = None
+    nspl["msoa11"] = None
+    nspl = nspl.sort_values("pcds", ignore_index=True)
+    os.makedirs(os.path.join(extdata, "nspl"), exist_ok=True)
+    pq.write_table(
+        pa.Table.from_pandas(nspl, preserve_index=False),
+        os.path.join(extdata, "nspl", os.path.basename(POSTCODE_TABLE_PATH)),
+        row_group_size=ROW_GROUP_SIZE,
+    )
+    return settings
+
+
+def relative_url(extdata, path):
+    """
+    Returns the url path of a file under extdata, relative to extdata.
+    """
+    return quote(Path(os.path.relpath(path, extdata)).as_posix())
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    """
+    Serves files without logging each request.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve(extdata):
+    """
+    Serves extdata over http on a free local port while the block runs, yielding its base url.
+    The downloader then checks the synthetic files as it checks real downloads, finding them unchanged by size.
+    """
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(_QuietHandler, directory=extdata)
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def served_settings(settings, base_url):
+    """
+    Returns a nation's settings from generate() with its relative urls completed with the base url of serve().
+    """
+    served = dict(settings)
+    for key in URL_SETTINGS:
+        if isinstance(settings.get(key), list):
+            served[key] = [base_url + url for url in settings[key]]
+        elif key in settings:
+            served[key] = base_url + settings[key]
+    return served
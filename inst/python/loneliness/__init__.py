@@ -0,0 +1,49 @@
+"""
+Loneliness index pipelines for the UK nations.
+
+Scotland, Wales and Northern Ireland share one prescription based pipeline, configured per nation in nations.py:
+build_preproc() in preproc.py scores GP practices from their prescriptions and build_idw() in scoring.py
+interpolates those scores onto the nation's zones. England is scored from the Community Life Survey in england.py.
+Other years of a nation are built under keys from job_key(), e.g. "scotland_2021", and many nations and years
+at once by run_batch() in batch.py. Run from the command line with python -m loneliness (see cli.py).
+
+Importing the package does no I/O and loads no third party libraries: the names below are imported on first use,
+and the pipeline modules import geopandas, rasterio, scipy, sklearn, pyarrow and matplotlib only where needed.
+"""
+import importlib
+
+# Public names and the modules they are imported from on first use
+_EXPORTS = {
+    "NATIONS": "nations",
+    "nation_config": "nations",
+    "NATION_YEARS": "nations",
+    "job_key": "nations",
+    "load_year_settings": "nations",
+    "EXTDATA_PATH": "paths",
+    "build_preproc": "preproc",
+    "build_idw": "scoring",
+    "build_cls_england": "england",
+    "run_batch": "batch",
+    "ConditionMatcher": "condition_matcher",
+    "PracticeDrugMatrix": "drug_matrix",
+    "IDWInterpolator": "idw",
+    "tune_idw_params": "idw",
+    "StageRunner": "stages",
+    "StageMetrics": "instrumentation",
+    "set_plot_mode": "plotting",
+    "main": "cli",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
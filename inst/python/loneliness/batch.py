@@ -0,0 +1,216 @@
+import os
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .nations import NATIONS, job_key, load_year_settings, nation_config
+from .paths import extdata_path
+
+# Builds the prescription based index for many (nation, year) jobs in one run, e.g. 2019-2025 for scotland, wales and ni
+# Work shared between jobs is done once, and the jobs' stages are spread over one pool of worker processes:
+#  1. files downloaded by more than one job, the NSPL postcode table and each distinct set of zone boundaries are
+#     prepared before any job starts
+#  2. each job downloads and aggregates its prescriptions into a practice x drug matrix (count_drugs in preproc.py)
+#  3. the drugs of every job are classified against drug_list.csv in one pass, filling the shared classification cache
+#  4. each job scores its GP practices and zones (count_condition onwards and the IDW stages)
+
+
+def parse_years(text):
+    """
+    Parses years given as e.g. "2019-2025", "2021,2022" or "2022" into a list of years, in order.
+    """
+    years = []
+    for part in text.split(","):
+        first, _, last = part.strip().partition("-")
+        try:
+            years += list(range(int(first), int(last or first) + 1))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid years {text!r}") from None
+    return list(dict.fromkeys(years))
+
+
+def _start_worker(settings_path, plot_mode):
+    """
+    Sets up a worker process of the pool: the same year settings and plot mode as the parent.
+    """
+    from .plotting import set_plot_mode
+
+    if settings_path is not None:
+        load_year_settings(settings_path)
+    set_plot_mode(plot_mode)
+
+
+def _job_runner(args, refresh):
+    """
+    Returns a StageRunner for one job, recording its stages to args.metrics and args.profile like the command line.
+    """
+    from .instrumentation import StageMetrics
+    from .stages import StageRunner
+
+    metrics = StageMetrics(
+        path=args.metrics,
+        profile_dir=args.profile,
+        profile_stages=args.profile_stage,
+    )
+    return StageRunner(refresh=refresh, metrics=metrics)
+
+
+def shared_downloads(jobs):
+    """
+    Returns {folder: urls} of the files that more than one job downloads into the same folder of inst/extdata/,
+    e.g. the GP details of a year whose settings keep the 2022 urls.
+    """
+    jobs_downloading = {}
+    for nation, year in jobs:
+        config = nation_config(job_key(nation, year))
+        downloads = [
+            (config["prescribing_folder"], url) for url in config["prescribing_urls"]
+        ]
+        downloads += [
+            (config["gp_details_folder"], url)
+            for url in config.get("gp_details_urls", [])
+        ]
+        if config.get("gp_list_url") is not None:
+            downloads.append((config["gp_details_folder"], config["gp_list_url"]))
+        for download in dict.fromkeys(downloads):
+            jobs_downloading[download] = jobs_downloading.get(download, 0) + 1
+
+    shared = {}
+    for (folder, url), count in jobs_downloading.items():
+        if count > 1:
+            shared.setdefault(folder, []).append(url)
+    return shared
+
+
+def prepare_shared(jobs, stages):
+    """
+    Does the work shared by jobs before any job starts, so jobs neither repeat it nor race to write the same files:
+    for the preproc stage, downloads the files more than one job uses; for the idw stage, builds the local NSPL
+    postcode table and fills the boundary store with each distinct set of zone boundaries.
+    The jobs then find the shared files up to date.
+    """
+    from .downloader import download_files
+
+    if "preproc" in stages:
+        for folder, urls in shared_downloads(jobs).items():
+            download_files(urls, extdata_path(folder))
+    if "idw" not in stages:
+        return
+
+    from .postcode_lookup import POSTCODE_TABLE_PATH, build_postcode_table
+    from .scoring import load_zone_boundaries
+
+    if not os.path.exists(POSTCODE_TABLE_PATH):
+        build_postcode_table()
+
+    boundaries = {}
+    for nation, year in jobs:
+        key = job_key(nation, year)
+        config = nation_config(key)
+        boundaries.setdefault((config["boundaries_url"], config["boundaries_crs"]), key)
+    for key in boundaries.values():
+        load_zone_boundaries(key)
+
+
+def count_job_drugs(nation, year, args):
+    """
+    Runs a job's count_drugs stage, downloading and aggregating its months.
+    Returns the job's distinct drugs and the records of its stages.
+    """
+    from .preproc import add_preproc_stages
+
+    key = job_key(nation, year)
+    runner = _job_runner(args, args.refresh)
+    add_preproc_stages(runner, key, window=args.window, robust=args.robust)
+    drug_matrix = runner.get(f"{key}/count_drugs")
+    return drug_matrix.drugs, runner.metrics.records
+
+
+def classify_drugs(drugs):
+    """
+    Classifies the distinct drugs of every job against drug_list.csv in one pass, saving them to the cache
+    that the jobs' ConditionMatcher reads, so no description is classified by more than one job.
+    """
+    import numpy as np
+    import pandas as pd
+    from .preproc import load_condition_matcher
+
+    drugs = np.unique(np.concatenate(drugs))
+    load_condition_matcher().flags(pd.Series(pd.Categorical(drugs)))
+    print(f"{len(drugs)} distinct drugs classified for all jobs")
+
+
+def build_job(nation, year, args):
+    """
+    Runs the stages of a job named in args.stage (every stage by default) as the command line would,
+    with months summarised in this process as the pool is shared between jobs.
+    Returns the records of its stages.
+    """
+    from .cli import run
+
+    key = job_key(nation, year)
+    runner = _job_runner(args, args.refresh)
+    job_args = argparse.Namespace(**{**vars(args), "workers": 1})
+    for stage in args.stage or ("preproc", "idw"):
+        run(key, stage, job_args, runner)
+    return runner.metrics.records
+
+
+def _run_jobs(executor, function, jobs, args):
+    """
+    Runs function(nation, year, args) for each job in the pool.
+    Returns {(nation, year): result} of the jobs that succeeded and prints the error of each job that failed.
+    """
+    futures = {
+        executor.submit(function, nation, year, args): (nation, year)
+        for nation, year in jobs
+    }
+    results = {}
+    for future in as_completed(futures):
+        nation, year = futures[future]
+        try:
+            results[(nation, year)] = future.result()
+        except Exception:
+            print(f"{nation} {year} failed:\n{traceback.format_exc()}")
+    return results
+
+
+def run_batch(jobs, args, metrics=None):
+    """
+    Builds each (nation, year) job in jobs, in args.workers processes shared by all jobs.
+    args holds the command line options (see cli.py); months within a job are not split across processes.
+    Stage records of every job are added to metrics, a StageMetrics, if given.
+    Returns the jobs that failed.
+    """
+    from .plotting import plot_mode
+
+    for nation, _ in jobs:
+        if nation not in NATIONS:
+            raise ValueError(f"Nation must be one of {list(NATIONS)}, not {nation!r}")
+    stages = args.stage or ("preproc", "idw")
+    # Plots cannot be shown from worker processes, so they are written to PNG files or skipped
+    mode = "png" if plot_mode() == "png" else "off"
+
+    prepare_shared(jobs, stages)
+    records = []
+    with ProcessPoolExecutor(
+        max_workers=max(args.workers, 1),
+        initializer=_start_worker,
+        initargs=(args.settings, mode),
+    ) as executor:
+        done = jobs
+        if "preproc" in stages:
+            drugs = _run_jobs(executor, count_job_drugs, jobs, args)
+            for job_drugs, job_records in drugs.values():
+                records += job_records
+            if drugs:
+                classify_drugs([job_drugs for job_drugs, _ in drugs.values()])
+            done = [job for job in jobs if job in drugs]
+        built = _run_jobs(executor, build_job, done, args)
+    for job_records in built.values():
+        records += job_records
+
+    if metrics is not None:
+        metrics.records += records
+    failed = [job for job in jobs if job not in built]
+    print(f"{len(built)} of {len(jobs)} jobs built")
+    return failed
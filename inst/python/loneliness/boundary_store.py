@@ -0,0 +1,89 @@
+import os
+import hashlib
+import tempfile
+import requests
+import geopandas as gpd
+from .instrumentation import count_download
+from .paths import extdata_path
+
+# Boundary sets downloaded once and kept as GeoParquet, one file per source url
+BOUNDARY_STORE_PATH = extdata_path("boundaries")
+
+# Per-row bounding box columns; Parquet min/max statistics on these let bbox reads skip row groups
+BBOX_COLUMNS = ["bbox_minx", "bbox_miny", "bbox_maxx", "bbox_maxy"]
+
+
+def boundary_path(
+    url, crs=None, simplify_tolerance=None, store_path=BOUNDARY_STORE_PATH
+):
+    """
+    Returns the path of a boundary set in the store, keyed by its source url, projection and simplification.
+    """
+    key = hashlib.sha256(f"{url}|{crs}|{simplify_tolerance}".encode()).hexdigest()
+    return os.path.join(store_path, f"{key[:16]}.parquet")
+
+
+def download_boundaries(url, shapefile=None, verify=True):
+    """
+    Downloads a boundary set: the named shapefile from a zipped shape file, or anything geopandas reads directly
+    (e.g. an ArcGIS FeatureServer query) when shapefile is None.
+    Returns a geo df of the boundaries.
+    """
+    if shapefile is None:
+        return gpd.read_file(url)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        zip_path = os.path.join(temp_dir, "boundaries.zip")
+        with requests.get(url, stream=True, verify=verify, timeout=600) as response:
+            response.raise_for_status()
+            with open(zip_path, "wb") as zip_file:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    zip_file.write(chunk)
+                    count_download(len(chunk))
+        return gpd.read_file(f"zip://{zip_path}!{shapefile}")
+
+
+def load_boundaries(
+    url,
+    shapefile=None,
+    crs="epsg:27700",
+    simplify_tolerance=None,
+    bbox=None,
+    verify=True,
+    store_path=BOUNDARY_STORE_PATH,
+):
+    """
+    Returns the boundaries from url, downloaded and saved to the store as GeoParquet on first use and read
+    memory mapped afterwards, so repeat runs make no network round trip and do not reproject.
+    crs projects the boundaries once before they are stored (EPSG:27700, British National Grid, by default);
+    None keeps the source crs.
+    simplify_tolerance also stores a copy of the geometries simplified to that many map units, as a "simplified"
+    geometry column for plotting.
+    bbox = (xmin, ymin, xmax, ymax) reads only the boundaries whose bounding boxes overlap it.
+    """
+    path = boundary_path(url, crs, simplify_tolerance, store_path)
+    if not os.path.exists(path):
+        print(f"Downloading boundaries from {url}")
+        boundaries = download_boundaries(url, shapefile, verify)
+        if crs is not None:
+            boundaries = boundaries.to_crs(crs)
+        boundaries[BBOX_COLUMNS] = boundaries.bounds.to_numpy()
+        if simplify_tolerance is not None:
+            boundaries["simplified"] = boundaries.geometry.simplify(
+                simplify_tolerance, preserve_topology=True
+            )
+        os.makedirs(store_path, exist_ok=True)
+        boundaries.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        print(f"{len(boundaries)} boundaries saved to {path}")
+
+    filters = None
+    if bbox is not None:
+        xmin, ymin, xmax, ymax = bbox
+        filters = [
+            ("bbox_maxx", ">=", xmin),
+            ("bbox_minx", "<=", xmax),
+            ("bbox_maxy", ">=", ymin),
+            ("bbox_miny", "<=", ymax),
+        ]
+    boundaries = gpd.read_parquet(path, filters=filters, memory_map=True)
+    return boundaries.drop(columns=BBOX_COLUMNS)
@@ -0,0 +1,264 @@
+import os
+import sys
+import time
+import argparse
+from .nations import (
+    DRUG_LIST_FILE,
+    NATIONS,
+    check_nation,
+    gp_scores_file,
+    job_key,
+    load_year_settings,
+    zone_scores_file,
+)
+from .batch import parse_years, run_batch
+from .paths import extdata_path
+
+# Stages of each nation, in the order they run; the idw stage reads the csv the preproc stage writes
+NATION_STAGES = {nation: ("preproc", "idw") for nation in NATIONS}
+NATION_STAGES["england"] = ("cls",)
+
+
+def stage_files(nation, stage):
+    """
+    Returns the input and output files of a stage, relative to inst/extdata/.
+    Downloads, stores and caches are not listed; they are created on first use.
+    """
+    if stage == "preproc":
+        return [DRUG_LIST_FILE], [gp_scores_file(nation)]
+    if stage == "idw":
+        return [gp_scores_file(nation)], [zone_scores_file(nation)]
+    return [], ["england_cls_loneliness_lsoa.csv"]
+
+
+def plan(nations, stages=None, years=None):
+    """
+    Returns the (nation, stage) pairs to run, in order, keeping only the named stages if stages is given.
+    years repeats each nation for each year, named by the keys from job_key() (e.g. "scotland_2021").
+    """
+    return [
+        (nation if year is None else job_key(nation, year), stage)
+        for nation in nations
+        for year in years or [None]
+        for stage in NATION_STAGES[nation]
+        if stages is None or stage in stages
+    ]
+
+
+def dry_run(steps):
+    """
+    Checks the settings of each nation and prints the stages that would run with their input and output files,
+    without importing the pipeline, downloading or reading any data.
+    Returns the number of problems found.
+    """
+    problems = 0
+    for nation in dict.fromkeys(nation for nation, stage in steps if stage != "cls"):
+        for problem in check_nation(nation):
+            print(f" {nation}: {problem}")
+            problems += 1
+
+    def describe(files):
+        return (
+            ", ".join(
+                f"{file} ({'found' if os.path.exists(extdata_path(file)) else 'missing'})"
+                for file in files
+            )
+            or "downloads"
+        )
+
+    print(f"Dry run: {len(steps)} stages, data in {extdata_path()}")
+    for nation, stage in steps:
+        inputs, outputs = stage_files(nation, stage)
+        print(f" {nation} {stage}: {describe(inputs)} -> {describe(outputs)}")
+    return problems
+
+
+def run(nation, stage, args, runner=None):
+    """
+    Runs one stage of a nation, importing its pipeline module on first use.
+    runner is the StageRunner shared by the stages, which skips the functions whose inputs are unchanged.
+    """
+    if stage == "preproc":
+        from .preproc import build_preproc
+
+        build_preproc(
+            nation,
+            workers=args.workers,
+            window=args.window,
+            robust=args.robust,
+            runner=runner,
+        )
+    elif stage == "idw":
+        from .scoring import build_idw
+
+        build_idw(nation, direct=args.direct, cellsize=args.cellsize, runner=runner)
+    else:
+        from .england import build_cls_england
+
+        build_cls_england()
+
+
+def parse_args(argv=None):
+    """
+    Parses the command line, defaulting to every stage of scotland, wales and ni.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m loneliness",
+        description="Builds the loneliness index for each nation.",
+    )
+    parser.add_argument(
+        "nations",
+        nargs="*",
+        help=f"nations to build, from {', '.join(NATION_STAGES)} (default: scotland wales ni)",
+    )
+    parser.add_argument(
+        "--stage",
+        action="append",
+        choices=sorted(
+            {stage for stages in NATION_STAGES.values() for stage in stages}
+        ),
+        help="only run this stage; may be repeated (default: every stage)",
+    )
+    parser.add_argument(
+        "--direct",
+        action="store_true",
+        help="score zones directly, skipping the grid over the GPs' bounding box",
+    )
+    parser.add_argument(
+        "--cellsize", type=int, default=250, help="grid cell size in metres"
+    )
+    parser.add_argument(
+        "--years",
+        type=parse_years,
+        metavar="YEARS",
+        help="build each nation for these years in one batch, e.g. 2019-2025 or 2021,2022 (default: 2022 only)",
+    )
+    parser.add_argument(
+        "--settings",
+        metavar="PATH",
+        help="json file of settings by nation and year, e.g. the prescribing_urls of other years",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="processes used to summarise months, or shared by the jobs of --years",
+    )
+    parser.add_argument(
+        "--window", type=int, default=None, help="keep only the latest window months"
+    )
+    parser.add_argument(
+        "--robust",
+        action="store_true",
+        help="standardise GP prescribing with the median and MAD rather than the mean and standard deviation",
+    )
+    parser.add_argument(
+        "--refresh",
+        nargs="*",
+        default=False,
+        metavar="STAGE",
+        help="rerun every function ignoring the stage cache, or only the functions named, e.g. count_drugs "
+        "or scotland/predict_grid; put it after the nations",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="append the time, memory, rows and bytes downloaded of each stage to PATH as JSON lines",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="write a cProfile profile of each stage that runs to DIR/<nation>_<stage>.prof",
+    )
+    parser.add_argument(
+        "--profile-stage",
+        action="append",
+        metavar="NAME",
+        help="only profile this stage, e.g. predict_grid; may be repeated",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="check settings and list the stages and files without running anything",
+    )
+    plots = parser.add_mutually_exclusive_group()
+    plots.add_argument("--headless", action="store_true", help="skip plots")
+    plots.add_argument(
+        "--plots-png", action="store_true", help="write plots to PNG files"
+    )
+    args = parser.parse_args(argv)
+
+    # Checked here rather than with choices, which argparse also applies to the default list
+    unknown = [nation for nation in args.nations if nation not in NATION_STAGES]
+    if unknown:
+        parser.error(f"unknown nations {unknown}, choose from {list(NATION_STAGES)}")
+    args.nations = args.nations or list(NATIONS)
+    # --refresh alone reruns every stage, with names only those stages
+    if args.refresh == []:
+        args.refresh = True
+    elif args.refresh:
+        args.refresh = set(args.refresh)
+        if args.refresh & set(NATION_STAGES):
+            parser.error(
+                "--refresh took a nation as a stage name, put it after the nations"
+            )
+    if args.years is not None and "england" in args.nations:
+        parser.error(
+            "--years only applies to the prescription based nations, not england"
+        )
+    return args
+
+
+def main(argv=None):
+    """
+    Command line entry point: python -m loneliness [nations ...] [--stage STAGE] [--dry-run] ...
+    """
+    start = time.perf_counter()
+    args = parse_args(argv)
+    if args.settings is not None:
+        load_year_settings(args.settings)
+    try:
+        steps = plan(args.nations, args.stage, args.years)
+    except ValueError as error:
+        print(error)
+        return 2
+
+    if args.dry_run:
+        problems = dry_run(steps)
+        print(f"Checked in {time.perf_counter() - start:.3f}s, {problems} problems")
+        return 1 if problems else 0
+
+    print("Running...")
+
+    if sys.base_prefix != sys.prefix:
+        venv_name = os.path.basename(sys.prefix)
+        print(f"You are in a virtual environment - {venv_name}")
+    else:
+        print("You are not in a virtual environment. Activate your venv")
+
+    from .instrumentation import StageMetrics
+    from .plotting import set_plot_mode, wait_for_plots
+    from .stages import StageRunner
+
+    if args.headless:
+        set_plot_mode("off")
+    elif args.plots_png:
+        set_plot_mode("png")
+
+    metrics = StageMetrics(
+        path=args.metrics,
+        profile_dir=args.profile,
+        profile_stages=args.profile_stage,
+    )
+    failed = []
+    if args.years is not None:
+        jobs = [(nation, year) for nation in args.nations for year in args.years]
+        failed = run_batch(jobs, args, metrics)
+    else:
+        runner = StageRunner(refresh=args.refresh, metrics=metrics)
+        for nation, stage in steps:
+            with metrics.measure(f"{nation}/{stage}", "step"):
+                run(nation, stage, args, runner)
+    wait_for_plots()
+    metrics.summary()
+    return 1 if failed else 0
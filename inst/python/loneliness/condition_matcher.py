@@ -0,0 +1,158 @@
+import re
+import hashlib
+import sqlite3
+import numpy as np
+import pandas as pd
+
+
+class ConditionMatcher:
+    """
+    Compiles the medications in drug_list.csv into a single case-insensitive pattern.
+    Labels each prescription description with every loneliness related illness it matches in one pass.
+    Classifications are cached per description, so each distinct description is only matched once across all months.
+    If cache_path is given, classifications are also persisted to a SQLite file keyed by a hash of the drug list,
+    so reruns and the other nations reuse them; editing drug_list.csv invalidates the cache.
+    Shared by the scotland, wales and ni prescription preprocessing in preproc.py.
+    """
+
+    def __init__(self, drug_list, cache_path=None):
+        self.illnesses = list(drug_list["illness"].unique())
+        self.drug_list_hash = hashlib.sha256(
+            drug_list[["illness", "medication"]].to_csv(index=False).encode()
+        ).hexdigest()
+
+        # Map each medication to the illnesses it indicates
+        medications = {}
+        for illness, medication in zip(drug_list["illness"], drug_list["medication"]):
+            medications.setdefault(medication.lower(), set()).add(
+                self.illnesses.index(illness)
+            )
+
+        # A match on a medication also implies every medication it contains (e.g. escitalopram -> citalopram),
+        # so fold those illnesses in up front rather than searching for overlapping matches
+        self._medication_illnesses = {
+            medication: tuple(
+                sorted(
+                    set().union(
+                        *(
+                            illnesses
+                            for other, illnesses in medications.items()
+                            if other in medication
+                        )
+                    )
+                )
+            )
+            for medication in medications
+        }
+
+        # Zero-width lookahead finds a match starting at every position, longest medication first
+        alternation = "|".join(
+            re.escape(medication)
+            for medication in sorted(medications, key=len, reverse=True)
+        )
+        self._pattern = re.compile(f"(?=({alternation}))", re.IGNORECASE)
+
+        # Illness indices for every normalised description classified so far
+        self._cache = {}
+        self._cache_path = cache_path
+        if cache_path is not None:
+            self._load_cache()
+
+    @staticmethod
+    def normalise(description):
+        """
+        Normalises a description to the key used by the cache.
+        Matching is case-insensitive, so descriptions differing only by case share an entry.
+        """
+        return description.lower()
+
+    def _connect(self):
+        """
+        Opens the SQLite cache, creating the classifications table if needed.
+        """
+        connection = sqlite3.connect(self._cache_path, timeout=60)
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS classifications (
+                drug_list_hash TEXT NOT NULL,
+                description TEXT NOT NULL,
+                illnesses TEXT NOT NULL,
+                PRIMARY KEY (drug_list_hash, description)
+            )
+            """
+        )
+        return connection
+
+    def _load_cache(self):
+        """
+        Reads the classifications stored for the current drug list into the in-memory cache.
+        """
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT description, illnesses FROM classifications WHERE drug_list_hash = ?",
+                (self.drug_list_hash,),
+            ).fetchall()
+        connection.close()
+        for description, illnesses in rows:
+            self._cache[description] = tuple(
+                self.illnesses.index(illness)
+                for illness in illnesses.split(";")
+                if illness
+            )
+        print(f"{len(rows)} cached drug classifications loaded from {self._cache_path}")
+
+    def _save_cache(self, descriptions):
+        """
+        Writes newly classified descriptions to the SQLite cache.
+        """
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO classifications VALUES (?, ?, ?)",
+                [
+                    (
+                        self.drug_list_hash,
+                        description,
+                        ";".join(self.illnesses[i] for i in self._cache[description]),
+                    )
+                    for description in descriptions
+                ],
+            )
+        connection.close()
+
+    def match(self, description):
+        """
+        Returns the sorted column indices of the illnesses a single description matches.
+        Missing descriptions match nothing.
+        """
+        if not isinstance(description, str):
+            return ()
+        matched = set()
+        for found in self._pattern.finditer(description):
+            matched.update(self._medication_illnesses[found.group(1).lower()])
+        return tuple(sorted(matched))
+
+    def flags(self, descriptions):
+        """
+        Takes in a series of prescription descriptions, ideally read as a categorical.
+        Classifies only the distinct descriptions not seen before and broadcasts them to rows through the category codes.
+        Returns a dataframe with one int16 column per illness, 1 where the description matches.
+        """
+        if not isinstance(descriptions.dtype, pd.CategoricalDtype):
+            descriptions = descriptions.astype("category")
+        categories = descriptions.cat.categories
+
+        # Lookup table of one row per category; the extra final row stays zero for missing values (code -1)
+        table = np.zeros((len(categories) + 1, len(self.illnesses)), dtype="int16")
+        new_descriptions = []
+        for row, description in enumerate(categories):
+            key = self.normalise(description)
+            if key not in self._cache:
+                self._cache[key] = self.match(key)
+                new_descriptions.append(key)
+            table[row, list(self._cache[key])] = 1
+
+        if self._cache_path is not None and new_descriptions:
+            self._save_cache(new_descriptions)
+
+        out = table[descriptions.cat.codes.to_numpy()]
+        return pd.DataFrame(out, index=descriptions.index, columns=self.illnesses)
@@ -0,0 +1,238 @@
+import os
+import json
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from .instrumentation import count_download
+
+# Metadata (ETag and size) of completed downloads is kept in a hidden manifest in each destination folder
+MANIFEST_NAME = ".downloads.json"
+
+# A partial download (.part) is kept with the ETag or Last-Modified date it was started from, to guard its resumption
+VALIDATOR_SUFFIX = ".validator"
+
+_manifest_lock = threading.Lock()
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where only threads of one process are kept from updating a manifest at once
+    fcntl = None
+
+
+@contextmanager
+def _locked_manifest(destination_folder):
+    """
+    Holds the manifest of a destination folder for an update: locked against other threads, and on POSIX against
+    other processes (e.g. batch jobs of the same nation) through a lock file next to it.
+    """
+    with _manifest_lock:
+        if fcntl is None:
+            yield
+            return
+        lock_path = os.path.join(destination_folder, MANIFEST_NAME + ".lock")
+        with open(lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_manifest(destination_folder):
+    """
+    Returns the download manifest of a destination folder, empty if none exists yet or it cannot be read,
+    in which case files are checked by size instead and the manifest is rewritten by the next download.
+    """
+    manifest_path = os.path.join(destination_folder, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path) as manifest_file:
+            return json.load(manifest_file)
+    except ValueError:
+        print(f"{manifest_path} is not valid json, ignoring it")
+        return {}
+
+
+def _update_manifest(destination_folder, filename, entry):
+    """
+    Records the ETag and size of a completed download in the destination folder's manifest.
+    The manifest is written to a temporary file of its own, then replaces the old one in a single step.
+    """
+    with _locked_manifest(destination_folder):
+        manifest = _read_manifest(destination_folder)
+        manifest[filename] = entry
+        file_descriptor, tmp_path = tempfile.mkstemp(
+            dir=destination_folder, prefix=MANIFEST_NAME, suffix=".tmp"
+        )
+        with os.fdopen(file_descriptor, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        os.replace(tmp_path, os.path.join(destination_folder, MANIFEST_NAME))
+
+
+def _read_validator(part_path):
+    """
+    Returns the ETag or Last-Modified date of the response a partial download was started from, or None.
+    """
+    validator_path = part_path + VALIDATOR_SUFFIX
+    if not os.path.exists(validator_path):
+        return None
+    with open(validator_path) as validator_file:
+        return validator_file.read() or None
+
+
+def _write_validator(part_path, headers):
+    """
+    Records the ETag, or else the Last-Modified date, of the response a partial download is started from.
+    """
+    with open(part_path + VALIDATOR_SUFFIX, "w") as validator_file:
+        validator_file.write(headers.get("ETag") or headers.get("Last-Modified") or "")
+
+
+def create_session(workers=8):
+    """
+    Creates a requests session whose connection pool is sized for the number of download threads.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def download_file(
+    url, destination_folder, session=None, verify=True, chunk_size=1024 * 1024
+):
+    """
+    Streams a single url to destination_folder in chunks, named after the last part of the url.
+    Skips the download if the file is already present with the same ETag or size as reported by the server.
+    Resumes partially downloaded (.part) files with an HTTP Range request, only when the server gave an ETag or
+    Last-Modified date for the partial file to check the file has not changed since; otherwise the download starts again.
+    A download whose size differs from the size the server reported is not kept.
+    Returns the path of the downloaded file, falling back to an existing copy if the download failed, or None if there is none.
+    """
+    session = session or requests.Session()
+    filename = os.path.basename(url)
+    file_path = os.path.join(destination_folder, filename)
+    part_path = file_path + ".part"
+
+    # Check whether the file has changed since it was last downloaded
+    try:
+        head = session.head(url, allow_redirects=True, verify=verify, timeout=60)
+        headers = head.headers if head.ok else {}
+    except requests.RequestException:
+        headers = {}
+    etag = headers.get("ETag")
+    # The size of an encoded (e.g. gzip) response is not the size of the file written
+    size = None
+    if headers.get("Content-Length") is not None and not headers.get(
+        "Content-Encoding"
+    ):
+        size = int(headers["Content-Length"])
+    if os.path.exists(file_path):
+        recorded_etag = _read_manifest(destination_folder).get(filename, {}).get("etag")
+        if etag is not None and recorded_etag is not None:
+            unchanged = etag == recorded_etag
+        else:
+            unchanged = size is not None and os.path.getsize(file_path) == size
+        if unchanged:
+            print(f"{filename} unchanged, skipping download")
+            return file_path
+
+    # Resume from the end of a partial download, provided the server can tell whether the file has changed since
+    # the partial file was started: with If-Range it sends the whole file (200) instead of the rest if it has
+    resume_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    validator = _read_validator(part_path) if resume_from else None
+    if resume_from and validator is None:
+        print(f"{filename} cannot be resumed without an ETag or Last-Modified date")
+        resume_from = 0
+
+    try:
+        status, etag = _fetch(
+            session, url, part_path, resume_from, validator, etag, verify, chunk_size
+        )
+        if status == 416 and (size is None or os.path.getsize(part_path) != size):
+            # The partial file is not the whole resource after all, so start again
+            resume_from = 0
+            status, etag = _fetch(
+                session, url, part_path, 0, None, etag, verify, chunk_size
+            )
+    except requests.RequestException as error:
+        print(f"Failed to download {url}: {error}")
+        return file_path if os.path.exists(file_path) else None
+    # A 416 is only a complete download in answer to a Range request
+    if status not in (200, 206) and not (status == 416 and resume_from):
+        print(f"Failed to download {url}")
+        return file_path if os.path.exists(file_path) else None
+
+    if size is not None and os.path.getsize(part_path) != size:
+        print(
+            f"Failed to download {url}: {os.path.getsize(part_path)} bytes received, {size} expected"
+        )
+        # Only a short partial file may be the start of the file; a longer one is discarded
+        if os.path.getsize(part_path) > size:
+            os.remove(part_path)
+        return file_path if os.path.exists(file_path) else None
+
+    os.replace(part_path, file_path)
+    if os.path.exists(part_path + VALIDATOR_SUFFIX):
+        os.remove(part_path + VALIDATOR_SUFFIX)
+    _update_manifest(
+        destination_folder,
+        filename,
+        {"url": url, "etag": etag, "size": os.path.getsize(file_path)},
+    )
+    print(f"{filename} successfully saved")
+    return file_path
+
+
+def _fetch(session, url, part_path, resume_from, validator, etag, verify, chunk_size):
+    """
+    Streams url into part_path, asking for the bytes from resume_from onwards if resume_from is non zero,
+    guarded by If-Range on validator.
+    Returns the response status and the ETag of the response (etag if it has none).
+    A 416 leaves part_path as it is, as the server holds no bytes beyond it.
+    """
+    headers = {}
+    if resume_from:
+        headers["Range"] = f"bytes={resume_from}-"
+        headers["If-Range"] = validator
+    with session.get(
+        url, headers=headers, stream=True, verify=verify, timeout=60
+    ) as response:
+        if response.status_code in (200, 206):
+            # A 200 means the server ignored the range or the file changed, so start the file again
+            mode = "ab" if response.status_code == 206 and resume_from else "wb"
+            if mode == "wb":
+                _write_validator(part_path, response.headers)
+            with open(part_path, mode) as file:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    file.write(chunk)
+                    count_download(len(chunk))
+            etag = response.headers.get("ETag", etag)
+        return response.status_code, etag
+
+
+def download_files(urls, destination_folder, workers=8, verify=True):
+    """
+    Downloads urls concurrently into destination_folder using a bounded thread pool and a shared connection pool.
+    Creates the destination folder if it doesn't exist.
+    Returns the paths of the files that were downloaded or already up to date, in the order of urls.
+    """
+    os.makedirs(destination_folder, exist_ok=True)
+    session = create_session(workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        file_paths = list(
+            executor.map(
+                lambda url: download_file(
+                    url, destination_folder, session=session, verify=verify
+                ),
+                urls,
+            )
+        )
+    session.close()
+    return [file_path for file_path in file_paths if file_path is not None]
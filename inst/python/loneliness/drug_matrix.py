@@ -0,0 +1,184 @@
+import zipfile
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from .practice_counts import COUNT_DTYPE
+
+# Items prescribed by each practice for each distinct drug description, as a sparse practices x drugs matrix
+# Built once from the raw months; any drug list is then applied as a matrix multiply against a drug x illness indicator
+
+# Drug standing in for prescriptions with a missing description, so they still count towards the items prescribed
+MISSING_DRUG = ""
+
+
+class PracticeDrugMatrix:
+    """
+    Sparse matrix of the items prescribed by practices (rows) for drugs, i.e. distinct prescription descriptions (columns).
+    practices and drugs label the rows and columns; postcodes holds each practice's GP postcode
+    for nations whose prescribing files come with GP addresses (wales), otherwise None.
+    """
+
+    def __init__(self, counts, practices, drugs, postcodes=None):
+        self.counts = sp.csr_matrix(counts, dtype=COUNT_DTYPE)
+        self.practices = np.asarray(practices)
+        self.drugs = np.asarray(drugs, dtype=object)
+        self.postcodes = (
+            None if postcodes is None else np.asarray(postcodes, dtype=object)
+        )
+
+    @property
+    def shape(self):
+        """
+        Number of practices and drugs.
+        """
+        return self.counts.shape
+
+    @property
+    def size(self):
+        """
+        Number of practice and drug pairs with items, reported as the rows of the stage building the matrix.
+        """
+        return self.counts.nnz
+
+    def select(self, rows, postcodes=None):
+        """
+        Returns the matrix restricted to the practices where the boolean array rows is True, with postcodes if given.
+        """
+        return PracticeDrugMatrix(
+            self.counts[rows], self.practices[rows], self.drugs, postcodes
+        )
+
+    def count_array(self, matcher):
+        """
+        Returns a 2D array of practices x the items prescribed, then the items prescribed for each illness of matcher,
+        a ConditionMatcher; the illness counts are one sparse matrix multiply against indicator_matrix().
+        """
+        items = np.asarray(self.counts.sum(axis=1)).ravel()
+        by_illness = (self.counts @ indicator_matrix(self.drugs, matcher)).toarray()
+        return np.column_stack([items, by_illness]).astype(COUNT_DTYPE)
+
+    def save(self, file):
+        """
+        Writes the matrix to file, a path or binary file object, as an uncompressed npz archive readable by load().
+        Members are written with a fixed timestamp so the same matrix always gives the same bytes.
+        """
+        arrays = {
+            "data": self.counts.data,
+            "indices": self.counts.indices,
+            "indptr": self.counts.indptr,
+            "shape": np.asarray(self.counts.shape),
+            "practices": _plain_array(self.practices),
+            "drugs": _plain_array(self.drugs),
+        }
+        if self.postcodes is not None:
+            # Practices without a postcode in the address file are stored as "" and marked, to be read back as NaN
+            arrays["postcodes"] = _plain_array(self.postcodes)
+            arrays["postcodes_missing"] = pd.isna(self.postcodes)
+        with zipfile.ZipFile(file, "w", allowZip64=True) as archive:
+            for name, array in arrays.items():
+                with archive.open(zipfile.ZipInfo(f"{name}.npy"), "w") as member:
+                    np.lib.format.write_array(member, array, allow_pickle=False)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a matrix written by save(), with missing postcodes as NaN.
+        """
+        with np.load(path) as arrays:
+            counts = sp.csr_matrix(
+                (arrays["data"], arrays["indices"], arrays["indptr"]),
+                shape=tuple(arrays["shape"]),
+            )
+            postcodes = None
+            if "postcodes" in arrays.files:
+                postcodes = arrays["postcodes"].astype(object)
+                # Files written before missing postcodes were marked hold them as "nan"
+                if "postcodes_missing" in arrays.files:
+                    missing = arrays["postcodes_missing"]
+                else:
+                    missing = postcodes == "nan"
+                postcodes[missing] = np.nan
+            return cls(counts, arrays["practices"], arrays["drugs"], postcodes)
+
+
+def _plain_array(values):
+    """
+    Converts an object array of strings to a fixed width unicode array, which npz archives store without pickling.
+    Missing values become "" rather than the string "nan".
+    """
+    values = np.asarray(values)
+    if values.dtype != object:
+        return values
+    return np.where(pd.isna(values), "", values).astype(str)
+
+
+def count_matrix(practices, descriptions, items):
+    """
+    Sums the items of each prescription into a PracticeDrugMatrix.
+    Descriptions are best given as a categorical, whose codes index the drugs directly.
+    Prescriptions with a missing practice are dropped, as a groupby would; those with a missing description are
+    counted under MISSING_DRUG.
+    """
+    if not isinstance(descriptions.dtype, pd.CategoricalDtype):
+        descriptions = descriptions.astype("category")
+    drugs = descriptions.cat.categories.to_numpy(dtype=object)
+    drug_codes = descriptions.cat.codes.to_numpy().astype("int64")
+    if (drug_codes < 0).any():
+        drugs = np.append(drugs, MISSING_DRUG)
+        drug_codes[drug_codes < 0] = len(drugs) - 1
+
+    # Keep only the drugs prescribed in this chunk, renumbering their codes
+    used = np.bincount(drug_codes, minlength=len(drugs)) > 0
+    drugs = drugs[used]
+    drug_codes = (np.cumsum(used) - 1)[drug_codes]
+
+    practice_codes, practices = pd.factorize(np.asarray(practices), sort=True)
+    keep = practice_codes >= 0
+    counts = sp.csr_matrix(
+        (
+            np.asarray(items, dtype="int64")[keep],
+            (practice_codes[keep], drug_codes[keep]),
+        ),
+        shape=(len(practices), len(drugs)),
+    )
+    # Duplicate practice and drug pairs are summed when converting to CSR
+    return PracticeDrugMatrix(counts, practices, drugs)
+
+
+def combine_matrices(matrices):
+    """
+    Adds PracticeDrugMatrix objects over the union of their practices and drugs, e.g. the months of a year.
+    A practice's postcode is taken from the first matrix it appears in.
+    """
+    if len(matrices) == 1:
+        return matrices[0]
+    practices = np.unique(np.concatenate([matrix.practices for matrix in matrices]))
+    drugs = np.unique(np.concatenate([matrix.drugs for matrix in matrices]))
+
+    rows, columns, data = [], [], []
+    for matrix in matrices:
+        counts = matrix.counts.tocoo()
+        rows.append(np.searchsorted(practices, matrix.practices)[counts.row])
+        columns.append(np.searchsorted(drugs, matrix.drugs)[counts.col])
+        data.append(counts.data.astype("int64"))
+    # Duplicate entries are summed when converting to CSR
+    counts = sp.csr_matrix(
+        (np.concatenate(data), (np.concatenate(rows), np.concatenate(columns))),
+        shape=(len(practices), len(drugs)),
+    )
+
+    postcodes = None
+    if matrices[0].postcodes is not None:
+        postcodes = np.empty(len(practices), dtype=object)
+        for matrix in reversed(matrices):
+            postcodes[np.searchsorted(practices, matrix.practices)] = matrix.postcodes
+    return PracticeDrugMatrix(counts, practices, drugs, postcodes)
+
+
+def indicator_matrix(drugs, matcher):
+    """
+    Returns a sparse drugs x illnesses matrix, 1 where a drug matches an illness of matcher, a ConditionMatcher.
+    Any drug list can be applied by building a ConditionMatcher from it, e.g. to compare a revised drug_list.csv.
+    """
+    flags = matcher.flags(pd.Series(pd.Categorical(drugs)))
+    return sp.csr_matrix(flags.to_numpy())
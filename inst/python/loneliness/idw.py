@@ -0,0 +1,108 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class IDWInterpolator:
+    """
+    Inverse distance weighted interpolator over the k nearest neighbours, weighting each neighbour by 1/dist**power.
+    Neighbours are found with a single cKDTree query per batch, run across workers threads (-1 uses all cores).
+    Query points that coincide with known points take the mean of the coincident values exactly.
+    dtype="float32" halves the memory of the weights and predictions.
+    Used by the scoring pipeline in scoring.py for every nation.
+    """
+
+    def __init__(
+        self, n_neighbors=5, power=2, dtype="float64", workers=-1, batch_size=500_000
+    ):
+        self.n_neighbors = n_neighbors
+        self.power = power
+        self.dtype = np.dtype(dtype)
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def fit(self, points, values):
+        """
+        Builds the neighbour index over the known points and stores their values.
+        """
+        self._tree = cKDTree(np.asarray(points, dtype="float64"))
+        self._values = np.asarray(values, dtype=self.dtype)
+        return self
+
+    def query(self, points, k=None):
+        """
+        Returns the distances and indices of the k nearest known points, as (n, k) arrays.
+        """
+        k = min(k or self.n_neighbors, len(self._values))
+        distances, indices = self._tree.query(points, k=k, workers=self.workers)
+        if k == 1:
+            distances, indices = distances[:, np.newaxis], indices[:, np.newaxis]
+        return distances.astype(self.dtype, copy=False), indices
+
+    def weigh(self, distances, values, power=None):
+        """
+        Interpolates from (n, k) arrays of neighbour distances and values.
+        Rows with a zero distance use only their coincident neighbours, with equal weights.
+        """
+        power = self.power if power is None else power
+        with np.errstate(divide="ignore"):
+            weights = np.power(distances, -power, dtype=self.dtype)
+        coincident = distances == 0
+        exact = coincident.any(axis=1)
+        weights[exact] = coincident[exact]
+        return np.einsum("ij,ij->i", weights, values) / weights.sum(axis=1)
+
+    def predict(self, points):
+        """
+        Predicts values for points in batches of batch_size rows, bounding the memory of the (n, k) arrays.
+        Returns a 1D array of predictions.
+        """
+        points = np.asarray(points, dtype="float64")
+        predictions = np.empty(len(points), dtype=self.dtype)
+        for start in range(0, len(points), self.batch_size):
+            batch = points[start : start + self.batch_size]
+            distances, indices = self.query(batch)
+            predictions[start : start + len(batch)] = self.weigh(
+                distances, self._values[indices]
+            )
+        return predictions
+
+
+def tune_idw_params(points, values, n_neighbors, powers, cv):
+    """
+    Grid searches the number of neighbours and IDW power by cross validation, scoring by mean R^2 as GridSearchCV does.
+    Neighbours are queried once per fold at the largest k; every smaller k is a prefix of that query and every power
+    is evaluated by vectorised reweighting, so a fine grid costs little more than a single fit per fold.
+    cv is a splitter such as sklearn's KFold.
+    Returns the best k, the best power and the (k, power) array of mean scores.
+    """
+    points = np.asarray(points, dtype="float64")
+    values = np.asarray(values, dtype="float64")
+    powers = np.asarray(powers, dtype="float64")
+    scores = np.zeros((len(n_neighbors), len(powers)))
+
+    for train_index, test_index in cv.split(points):
+        model = IDWInterpolator(max(n_neighbors)).fit(
+            points[train_index], values[train_index]
+        )
+        distances, indices = model.query(points[test_index])
+        neighbour_values = model._values[indices]
+        actual = values[test_index]
+        total = ((actual - actual.mean()) ** 2).sum()
+
+        for i, k in enumerate(n_neighbors):
+            # Weights for every power at once: (n, k, powers)
+            k_distances = distances[:, :k, np.newaxis]
+            with np.errstate(divide="ignore"):
+                weights = k_distances**-powers
+            coincident = k_distances == 0
+            exact = coincident.any(axis=1)[:, 0]
+            weights[exact] = np.broadcast_to(coincident[exact], weights[exact].shape)
+            predicted = np.einsum(
+                "ikp,ik->ip", weights, neighbour_values[:, :k]
+            ) / weights.sum(axis=1)
+            residual = ((actual[:, np.newaxis] - predicted) ** 2).sum(axis=0)
+            scores[i] += 1 - residual / total
+
+    scores /= cv.get_n_splits(points)
+    best_i, best_j = np.unravel_index(np.argmax(scores), scores.shape)
+    return n_neighbors[best_i], powers[best_j].item(), scores
@@ -0,0 +1,218 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where peak memory is not recorded
+    resource = None
+
+# Per-stage measurements of the pipelines: wall and CPU time, peak memory, rows in and out and bytes downloaded
+# Kept to the standard library so the runner and downloaders can record without importing anything heavy
+
+_bytes_downloaded = 0
+_bytes_lock = threading.Lock()
+
+# Peak memory of the stages being measured in this process, innermost last, as [own peak, worker peak] in MB
+_peaks = []
+
+
+def count_download(size):
+    """
+    Adds size bytes to the running total of bytes downloaded in this process; called by each download loop.
+    """
+    global _bytes_downloaded
+    with _bytes_lock:
+        _bytes_downloaded += size
+
+
+def bytes_downloaded():
+    """
+    Returns the number of bytes downloaded in this process so far.
+    """
+    return _bytes_downloaded
+
+
+def _max_rss_mb():
+    """
+    Returns the ru_maxrss of this process in MB, its peak since it started. None where it cannot be read.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in KB elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def reset_peak_rss():
+    """
+    Resets the peak resident memory of this process to its current size, so the next peak_rss_mb() covers only
+    what runs in between. Only possible on Linux; returns whether it was reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident memory of this process in MB since reset_peak_rss() on Linux (VmHWM), elsewhere since
+    the process started, or None where it cannot be read.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return _max_rss_mb()
+
+
+def call_measured(function, *args):
+    """
+    Runs function(*args) in a worker process, e.g. a month in a process pool, and returns its result with the peak
+    memory of the worker while it ran; pass the pair to worker_result() in the parent.
+    """
+    reset_peak_rss()
+    return function(*args), peak_rss_mb()
+
+
+def worker_result(measured):
+    """
+    Returns the result of a call_measured() pair, adding its worker's peak memory to the stage being measured.
+    """
+    result, peak = measured
+    if _peaks and peak is not None:
+        _peaks[-1][1] = max(_peaks[-1][1] or 0, peak)
+    return result
+
+
+def cpu_seconds():
+    """
+    Returns the CPU time used by this process and its finished child processes, e.g. a pool of month workers.
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def count_rows(value):
+    """
+    Returns the number of rows of a data frame, the number of cells of an array, or None for other values.
+    """
+    if hasattr(value, "columns") and hasattr(value, "__len__"):
+        return len(value)
+    if hasattr(value, "size") and hasattr(value, "shape"):
+        return int(value.size)
+    return None
+
+
+class StageMetrics:
+    """
+    Records one measurement per stage or step of a run: wall time, CPU time, peak memory, rows in and out
+    and bytes downloaded, kept in records and appended as a JSON line to path if given.
+    Peak memory is the peak the stage itself reached in this process (on Linux; elsewhere the peak of the process so
+    far), and separately the largest peak reported by the worker processes it ran through call_measured(), e.g. a pool
+    of month workers; other child processes are not counted.
+    profile_dir writes a cProfile profile of each stage that runs to <stage>.prof, readable with pstats or snakeviz;
+    profile_stages limits profiling to the named stages (full names or e.g. "predict_grid").
+    """
+
+    def __init__(self, path=None, profile_dir=None, profile_stages=None):
+        self.path = path
+        self.profile_dir = profile_dir
+        self.profile_stages = profile_stages
+        self.records = []
+
+    def _profiling(self, name, status):
+        """
+        Whether a stage is profiled: stages that run, when profiling is on and the stage is selected.
+        """
+        if self.profile_dir is None or status != "run":
+            return False
+        if self.profile_stages is None:
+            return True
+        return name in self.profile_stages or name.split("/")[-1] in self.profile_stages
+
+    @contextmanager
+    def measure(self, name, status="run", rows_in=None):
+        """
+        Measures the block run inside it as stage name, with status "run", "cached" or "step".
+        rows_in maps inputs to their rows; the block may set rows_out on the record it is given.
+        """
+        record = {
+            "stage": name,
+            "status": status,
+            "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "rows_in": rows_in,
+            "rows_out": None,
+        }
+        profiler = cProfile.Profile() if self._profiling(name, status) else None
+        # The peak so far counts towards any enclosing stage, as resetting it for this stage would lose it
+        if _peaks:
+            _peaks[-1][0] = max(_peaks[-1][0], peak_rss_mb() or 0)
+        reset_peak_rss()
+        _peaks.append([0, None])
+        downloaded = bytes_downloaded()
+        cpu = cpu_seconds()
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record["wall_s"] = round(time.perf_counter() - start, 3)
+            record["cpu_s"] = round(cpu_seconds() - cpu, 3)
+            own_peak, worker_peak = _peaks.pop()
+            peak = peak_rss_mb()
+            record["peak_rss_mb"] = None if peak is None else max(own_peak, peak)
+            record["peak_worker_rss_mb"] = worker_peak
+            if _peaks:
+                _peaks[-1][0] = max(_peaks[-1][0], record["peak_rss_mb"] or 0)
+                if worker_peak is not None:
+                    _peaks[-1][1] = max(_peaks[-1][1] or 0, worker_peak)
+            record["bytes_downloaded"] = bytes_downloaded() - downloaded
+            if profiler is not None:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                record["profile"] = os.path.join(
+                    self.profile_dir, f"{name.replace('/', '_')}.prof"
+                )
+                profiler.dump_stats(record["profile"])
+            self.records.append(record)
+            if self.path is not None:
+                with open(self.path, "a") as metrics_file:
+                    metrics_file.write(json.dumps(record) + "\n")
+
+    def summary(self, top=10):
+        """
+        Prints the stages that took longest, to show which dominates a run.
+        Whole steps are only listed if no stages were measured within them, as for england.
+        """
+        stages = sorted(
+            [record for record in self.records if record["status"] != "step"]
+            or self.records,
+            key=lambda record: record["wall_s"],
+            reverse=True,
+        )
+        if not stages:
+            return
+        print("Slowest stages:")
+        for record in stages[:top]:
+            workers = record.get("peak_worker_rss_mb")
+            print(
+                f" {record['stage']} ({record['status']}): {record['wall_s']:.2f}s wall, {record['cpu_s']:.2f}s CPU, "
+                f"peak {record['peak_rss_mb']} MB"
+                + (f" ({workers} MB in workers)" if workers is not None else "")
+                + f", {record['rows_out']} rows out"
+            )
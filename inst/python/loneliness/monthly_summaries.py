@@ -0,0 +1,122 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from .drug_matrix import PracticeDrugMatrix
+from .instrumentation import call_measured, worker_result
+from .paths import extdata_path
+from .prescribing_reader import CHUNKSIZE
+from .prescribing_store import month_key
+
+# Per-month practice x drug matrices of items prescribed, stored as nation=<nation>/<YYYY-MM>.npz
+# They do not depend on drug_list.csv, so a revised drug list is applied without reprocessing any month
+SUMMARY_PATH = extdata_path("prescribing_summaries")
+MANIFEST_NAME = "manifest.json"
+
+
+def _read_manifest(folder):
+    """
+    Returns the manifest of processed months in a nation's summary folder, empty if none exists yet.
+    """
+    manifest_path = os.path.join(folder, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def _write_manifest(folder, manifest):
+    """
+    Writes the manifest of processed months, replacing the previous one in a single step.
+    """
+    manifest_path = os.path.join(folder, MANIFEST_NAME)
+    with open(manifest_path + ".tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def fingerprint(file_path, settings=None):
+    """
+    Identifies the input a month's summary was computed from: the downloaded file and the settings it was read with.
+    """
+    stat = os.stat(file_path)
+    return {
+        "file": os.path.basename(file_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "settings": hashlib.sha256(
+            json.dumps(settings, sort_keys=True, default=str).encode()
+        ).hexdigest(),
+    }
+
+
+def update_monthly_summaries(
+    files,
+    nation,
+    summarise_month,
+    workers=1,
+    chunksize=CHUNKSIZE,
+    window=None,
+    settings=None,
+    summary_path=SUMMARY_PATH,
+):
+    """
+    Returns the PracticeDrugMatrix of each month in files, ordered by month.
+    Only months that are new, or whose downloaded file or settings (e.g. the columns and dtypes read) have changed
+    since the manifest was written, are run through summarise_month(file_path, chunksize); the rest are read from their stored matrices.
+    workers > 1 summarises the outstanding months in parallel in a process pool.
+    window keeps only the latest window months, evicting older months from the manifest and disk (a rolling window).
+    """
+    folder = os.path.join(summary_path, f"nation={nation}")
+    os.makedirs(folder, exist_ok=True)
+    manifest = _read_manifest(folder)
+
+    # Restrict to the latest months if using a rolling window
+    months = {month_key(file_path): file_path for file_path in files}
+    if window is not None:
+        months = dict(sorted(months.items())[-window:])
+        for month in set(manifest) - set(months):
+            summary_file = os.path.join(folder, f"{month}.npz")
+            if os.path.exists(summary_file):
+                os.remove(summary_file)
+            del manifest[month]
+            print(f" {month} evicted from the {window} month window")
+
+    # Summarise months that are new or have changed
+    outstanding = [
+        month
+        for month, file_path in months.items()
+        if manifest.get(month) != fingerprint(file_path, settings)
+        or not os.path.exists(os.path.join(folder, f"{month}.npz"))
+    ]
+    print(
+        f" {len(months) - len(outstanding)} months up to date, {len(outstanding)} to process"
+    )
+    outstanding_files = [months[month] for month in outstanding]
+    if workers > 1 and len(outstanding) > 1:
+        # Each worker reports its peak memory to the stage running this
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            summaries = [
+                worker_result(measured)
+                for measured in executor.map(
+                    call_measured,
+                    repeat(summarise_month),
+                    outstanding_files,
+                    repeat(chunksize),
+                )
+            ]
+    else:
+        summaries = [
+            summarise_month(file_path, chunksize) for file_path in outstanding_files
+        ]
+
+    for month, summary in zip(outstanding, summaries):
+        summary.save(os.path.join(folder, f"{month}.npz"))
+        manifest[month] = fingerprint(months[month], settings)
+    _write_manifest(folder, manifest)
+
+    return [
+        PracticeDrugMatrix.load(os.path.join(folder, f"{month}.npz"))
+        for month in sorted(months)
+    ]
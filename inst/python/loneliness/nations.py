@@ -0,0 +1,322 @@
+import json
+
+# Settings of the prescription based loneliness pipeline for each nation, shared by preproc.py and scoring.py
+# Only the standard library is used here, so the configuration can be read and checked without loading the pipeline
+
+# Year of the prescribing data and of the GP and zone outputs in NATIONS; other years are set in NATION_YEARS
+YEAR = 2022
+
+# Medications associated with loneliness related conditions, and the cache of their classifications
+DRUG_LIST_FILE = "drug_list.csv"
+CONDITION_CACHE_FILE = "condition_cache.sqlite"
+
+# Settings every nation needs, checked by check_nation()
+REQUIRED_SETTINGS = [
+    "name",
+    "prescribing_urls",
+    "prescribing_folder",
+    "prescribing_dtypes",
+    "prescribing_columns",
+    "read_kwargs",
+    "zip_members",
+    "gp_details_folder",
+    "zone",
+    "zone_label",
+    "boundaries_url",
+    "boundaries_shapefile",
+    "boundaries_crs",
+    "boundaries_verify",
+    "expected_zones",
+    "zone_code_column",
+    "zone_code_name",
+    "idw_neighbours",
+    "idw_powers",
+    "reverse_deciles",
+]
+
+NATIONS = {
+    "scotland": {
+        "name": "Scotland",
+        # Prescription in the Community csv files
+        # https://www.opendata.nhs.scot/dataset/prescriptions-in-the-community
+        "prescribing_urls": [
+            "https://www.opendata.nhs.scot/dataset/84393984-14e9-4b0d-a797-b288db64d088/resource/00213ffa-941e-4389-9e6f-3bca8067da8c/download/pitc202212.csv",
+            "https://www.opendata.nhs.scot/dataset/84393984-14e9-4b0d-a797-b288db64d088/resource/023986c0-3bb2-43cb-84e8-2e0b3bb1f55f/download/pitc202211.csv",
+            "https://www.opendata.nhs.scot/dataset/84393984-14e9-4b0d-a797-b288db64d088/resource/bd7bc2cf-4de5-4711-bd5a-9e3b77305453/download/pitc202210.csv",
+            "https://www.opendata.nhs.scot/dataset/84393984-14e9-4b0d-a797-b288db64d088/resource/9d0a518d-9d9c-4bcb-afd8-51f6abb7edf1/download/pitc202209.csv",
+            "https://www.opendata.nhs.scot/dataset/84393984-14e9-4b0d-a797-b288db64d088/resource/49fa5784-be06-4015-bc6d-9b5db8726473/download/pitc202208.csv",
+            "https://www.opendata.nhs.scot/dataset/84393984-14e9-4b0d-a797-b288db64d088/resource/26ce66f1-e7f2-4c71-9995-5dc65f76ecfb/download/pitc202207.csv",
+            "https://www.opendata.nhs.scot/dataset/84393984-14e9-4b0d-a797-b288db64d088/resource/debeadd8-2bbb-4dd3-82de-831531bab2cb/download/pitc202206.csv",
+            "https://www.opendata.nhs.scot/dataset/84393984-14e9-4b0d-a797-b288db64d088/resource/1b4e3200-b6e6-415f-b19a-b9ef927db1ab/download/pitc202205.csv",
+            "https://www.opendata.nhs.scot/dataset/84393984-14e9-4b0d-a797-b288db64d088/resource/7de8c908-86f8-45ac-b6a4-e21d1df30584/download/pitc202204.csv",
+            "https://www.opendata.nhs.scot/dataset/84393984-14e9-4b0d-a797-b288db64d088/resource/a0ec3bf2-7339-413b-9c66-2891cfd7919f/download/pitc202203.csv",
+            "https://www.opendata.nhs.scot/dataset/84393984-14e9-4b0d-a797-b288db64d088/resource/bd7aa5c9-d708-4d0b-9b28-a9d822c84e34/download/pitc202202.csv",
+            "https://www.opendata.nhs.scot/dataset/84393984-14e9-4b0d-a797-b288db64d088/resource/53a53d61-3b3b-4a12-888b-a788ce13db9c/download/pitc202201.csv",
+        ],
+        "prescribing_folder": "pitc_scotland",
+        # Columns read from the monthly prescribing files, their compact dtypes and their normalised names in the Parquet store
+        # Practice codes and items are nullable, so a blank cell is read as missing instead of failing the read;
+        # read_partition_in_chunks() in prescribing_store.py then drops rows without a practice and counts missing items as 0
+        "prescribing_dtypes": {
+            "GPPractice": "Int32",
+            "BNFItemDescription": "category",
+            "NumberOfPaidItems": "Int32",
+        },
+        "prescribing_columns": {
+            "GPPractice": "practice",
+            "BNFItemDescription": "description",
+            "NumberOfPaidItems": "items",
+        },
+        "read_kwargs": {},
+        # Names of the prescribing and address csvs inside zipped monthly files; None for plain csv files
+        "zip_members": None,
+        # GP contact details csv files, joined to the prescriptions to get GP postcodes
+        # https://www.opendata.nhs.scot/dataset/gp-practice-contact-details-and-list-sizes
+        "gp_details_urls": [
+            "https://www.opendata.nhs.scot/dataset/f23655c3-6e23-4103-a511-a80d998adb90/resource/1a15cb34-fcf9-4d3f-ad63-1ba3e675fbe2/download/practice_contactdetails_oct2022-open-data.csv",
+            "https://www.opendata.nhs.scot/dataset/f23655c3-6e23-4103-a511-a80d998adb90/resource/5273d444-5a79-4fad-a518-119a368e2161/download/practice_contactdetails_jul2022-open-data.csv",
+            "https://www.opendata.nhs.scot/dataset/f23655c3-6e23-4103-a511-a80d998adb90/resource/8175c9ac-6953-4636-b151-f3946ef0fb80/download/practice_contactdetails_apr2022-open-data.csv",
+            "https://www.opendata.nhs.scot/dataset/f23655c3-6e23-4103-a511-a80d998adb90/resource/1f76c338-7890-4ee7-b1bd-4d837cc1d50a/download/practice_contactdetails_jan2022.csv",
+        ],
+        "gp_details_folder": "gp_details_scotland",
+        "gp_details_practice_column": "PracticeCode",
+        # Practices with two postcodes assigned to them; only the first is kept
+        "duplicate_postcode_practices": [2910096, 258060],
+        # Data Zone boundaries shape files
+        "zone": "dz",
+        "zone_label": "dz",
+        "boundaries_url": "https://maps.gov.scot/ATOM/shapefiles/SG_DataZoneBdry_2011.zip",
+        "boundaries_shapefile": "SG_DataZone_Bdry_2011.shp",
+        "boundaries_crs": "epsg:27700",
+        "boundaries_verify": False,
+        "expected_zones": None,
+        "zone_code_column": "DataZone",
+        "zone_code_name": "dz11_code",
+        # IDW grid search: numbers of neighbours, and powers as np.arange(start, stop, step)
+        "idw_neighbours": range(3, 21),
+        "idw_powers": (1, 3.25, 0.25),
+        "reverse_deciles": True,
+    },
+    "wales": {
+        "name": "Wales",
+        # Prescribing Data zip folders
+        # https://nwssp.nhs.wales/ourservices/primary-care-services/general-information/data-and-publications/prescribing-data-extracts/general-practice-prescribing-data-extract/
+        "prescribing_urls": [
+            "https://nwssp.nhs.wales/ourservices/primary-care-services/primary-care-services-documents/general-practice-prescribing-data-extract-docs/gp-data-extract-december-2022",
+            "https://nwssp.nhs.wales/ourservices/primary-care-services/primary-care-services-documents/general-practice-prescribing-data-extract-docs/gp-data-extract-november-2022",
+            "https://nwssp.nhs.wales/ourservices/primary-care-services/primary-care-services-documents/general-practice-prescribing-data-extract-docs/gp-data-extract-october-2022",
+            "https://nwssp.nhs.wales/ourservices/primary-care-services/primary-care-services-documents/general-practice-prescribing-data-extract-docs/gp-data-extract-september-2022",
+            "https://nwssp.nhs.wales/ourservices/primary-care-services/primary-care-services-documents/general-practice-prescribing-data-extract-docs/gp-data-extract-august-2022",
+            "https://nwssp.nhs.wales/ourservices/primary-care-services/primary-care-services-documents/general-practice-prescribing-data-extract-docs/gp-data-extract-july-2022",
+            "https://nwssp.nhs.wales/ourservices/primary-care-services/primary-care-services-documents/general-practice-prescribing-data-extract-docs/gp-data-extract-june-2022",
+            "https://nwssp.nhs.wales/ourservices/primary-care-services/primary-care-services-documents/general-practice-prescribing-data-extract-docs/gp-data-extract-may-2022",
+            "https://nwssp.nhs.wales/ourservices/primary-care-services/primary-care-services-documents/general-practice-prescribing-data-extract-docs/gp-data-extract-march-2022",
+            "https://nwssp.nhs.wales/ourservices/primary-care-services/primary-care-services-documents/general-practice-prescribing-data-extract-docs/gp-data-extract-february-2022",
+            "https://nwssp.nhs.wales/ourservices/primary-care-services/primary-care-services-documents/general-practice-prescribing-data-extract-docs/gp-data-extract-january-2022",
+        ],
+        "prescribing_folder": "pitc_wales",
+        "prescribing_dtypes": {
+            "PracticeID": "category",
+            "BNFName": "category",
+            "Items": "Int32",
+        },
+        "prescribing_columns": {
+            "PracticeID": "practice",
+            "BNFName": "description",
+            "Items": "items",
+        },
+        "read_kwargs": {},
+        "zip_members": {"prescribing": "GPData", "address": "Address"},
+        "address_practice_column": "PracticeId",
+        # GP postcodes come from the address file in each zip folder; the list of GPs only excludes e.g. pharmacies
+        # https://nwssp.nhs.wales/ourservices/primary-care-services/general-information/data-and-publications/prescribing-data-extracts/gp-practice-analysis/
+        "gp_list_url": "https://nwssp.nhs.wales/ourservices/primary-care-services/primary-care-services-documents/gp-practice-analysis-docs/gp-practice-analysis-2022",
+        "gp_details_folder": "gp_details_wales",
+        # LSOA shape files, filtered for Wales
+        "zone": "lsoa",
+        "zone_label": "LSOA",
+        "boundaries_url": "https://services1.arcgis.com/ESMARspQHYMw9BZ9/arcgis/rest/services/LSOA_Dec_2021_Boundaries_Generalised_Clipped_EW_BGC_2022/FeatureServer/0/query?where=LSOA21CD+LIKE+'W%25'&outFields=*&outSR=4326&f=json",
+        "boundaries_shapefile": None,
+        "boundaries_crs": "epsg:27700",
+        "boundaries_verify": True,
+        "expected_zones": 1917,
+        "zone_code_column": "LSOA21CD",
+        "zone_code_name": "lsoa21_code",
+        "idw_neighbours": range(3, 16),
+        "idw_powers": (0.5, 3.25, 0.25),
+        "reverse_deciles": False,
+    },
+    "ni": {
+        "name": "Northern Ireland",
+        # GP Prescribing Data csv files
+        # https://www.data.gov.uk/dataset/a7b76920-bc0a-48fd-9abf-dc5ad0999886/gp-prescribing-data
+        "prescribing_urls": [
+            "https://admin.opendatani.gov.uk/dataset/a7b76920-bc0a-48fd-9abf-dc5ad0999886/resource/6d56613a-968b-4ebb-97f2-e19b637744a1/download/gp-prescribing---december-2022.csv",
+            "https://admin.opendatani.gov.uk/dataset/a7b76920-bc0a-48fd-9abf-dc5ad0999886/resource/968d637e-073a-4b1a-a3e1-be9050c0fb36/download/08.-gp-prescribing---november-2022.csv",
+            "https://admin.opendatani.gov.uk/dataset/a7b76920-bc0a-48fd-9abf-dc5ad0999886/resource/6b2b80a6-ea5d-419b-a7a3-89267c37c5c3/download/gp-prescribing---october-2022.csv",
+            "https://admin.opendatani.gov.uk/dataset/a7b76920-bc0a-48fd-9abf-dc5ad0999886/resource/fb419ac5-21aa-4daf-b1a5-3f08d1339a09/download/gp-prescribing---september-2022.csv",
+            "https://admin.opendatani.gov.uk/dataset/a7b76920-bc0a-48fd-9abf-dc5ad0999886/resource/93517fa2-1cd3-4640-a64f-c747748e3fce/download/gp-prescribing---august-2022.csv",
+            "https://admin.opendatani.gov.uk/dataset/a7b76920-bc0a-48fd-9abf-dc5ad0999886/resource/9be6af28-ec9f-4b25-8760-19d439ec45cd/download/gp-prescribing---july-2022.csv",
+            "https://admin.opendatani.gov.uk/dataset/a7b76920-bc0a-48fd-9abf-dc5ad0999886/resource/ceb972fd-1576-4738-a416-0f5a0f8e2927/download/gp-prescribing---june-2022.csv",
+            "https://admin.opendatani.gov.uk/dataset/a7b76920-bc0a-48fd-9abf-dc5ad0999886/resource/c6647529-298f-49b3-a1bb-4d1b3bdcd315/download/gp-prescribing---may-2022.csv",
+            "https://admin.opendatani.gov.uk/dataset/a7b76920-bc0a-48fd-9abf-dc5ad0999886/resource/2d8ade34-6ed0-4d9b-a909-7c3c738320c3/download/gp-prescribing-march-2022.csv",
+            "https://admin.opendatani.gov.uk/dataset/a7b76920-bc0a-48fd-9abf-dc5ad0999886/resource/486c153c-a2dc-4275-994f-21c01763f4f6/download/gp-prescribing-february-2022.csv",
+            "https://admin.opendatani.gov.uk/dataset/a7b76920-bc0a-48fd-9abf-dc5ad0999886/resource/d255072d-58fe-4658-8180-86fee053e240/download/gp-prescribing-january-2022-v2.csv",
+        ],
+        "prescribing_folder": "pitc_ni",
+        "prescribing_dtypes": {
+            "Practice": "Int32",
+            "VTM_NM": "category",
+            "Total Items": "Int32",
+        },
+        "prescribing_columns": {
+            "Practice": "practice",
+            "VTM_NM": "description",
+            "Total Items": "items",
+        },
+        "read_kwargs": {"encoding": "ISO-8859-1"},
+        "zip_members": None,
+        # GP Practice Contact Details and List Sizes csv files
+        # https://www.data.gov.uk/dataset/3d1a6615-5fc9-4f0e-ab2a-d2b0d71fb9ed/gp-practice-list-sizes
+        "gp_details_urls": [
+            "https://admin.opendatani.gov.uk/dataset/3d1a6615-5fc9-4f0e-ab2a-d2b0d71fb9ed/resource/d8e77f57-120c-44d9-b360-f52e74ea4add/download/gp-practice-reference-file---october-2022.csv",
+            "https://admin.opendatani.gov.uk/dataset/3d1a6615-5fc9-4f0e-ab2a-d2b0d71fb9ed/resource/5311b385-0551-4494-a3ac-cbbc5f84289c/download/gp-practice-reference-file--july-2022.csv",
+            "https://admin.opendatani.gov.uk/dataset/3d1a6615-5fc9-4f0e-ab2a-d2b0d71fb9ed/resource/8f910a09-3cb6-4071-85c3-0e7677965de2/download/gp-practice-reference-file--april-2022.csv",
+            "https://admin.opendatani.gov.uk/dataset/3d1a6615-5fc9-4f0e-ab2a-d2b0d71fb9ed/resource/80b06a43-2d1f-47c2-9142-7f46e9ea6e8b/download/gp-practice-reference-file--january-2022.csv",
+        ],
+        "gp_details_folder": "gp_details_ni",
+        "gp_details_practice_column": "PracNo",
+        "duplicate_postcode_practices": [2412, 6516, 6432, 900, 828],
+        # Super Data Zones shape files, kept in the shape file's own crs, which the SDZs have always been scored in
+        "zone": "sdz",
+        "zone_label": "SDZ",
+        "boundaries_url": "https://www.nisra.gov.uk/sites/nisra.gov.uk/files/publications/geography-sdz2021-esri-shapefile.zip",
+        "boundaries_shapefile": "SDZ2021.shp",
+        "boundaries_crs": None,
+        "boundaries_verify": False,
+        "expected_zones": 850,
+        "zone_code_column": "SDZ2021_cd",
+        "zone_code_name": "sdz21_code",
+        # Use lower neighbours as have small dataset
+        "idw_neighbours": range(2, 9),
+        "idw_powers": (0.5, 2.75, 0.25),
+        "reverse_deciles": False,
+    },
+}
+
+
+# Settings of each nation for years other than YEAR, {nation: {year: settings}}, each updating the nation's settings
+# in NATIONS; typically that year's prescribing_urls and GP details urls. Set here or with load_year_settings()
+NATION_YEARS = {nation: {} for nation in NATIONS}
+
+# Settings of the (nation, year) keys made by job_key(), e.g. "scotland_2021"
+_year_configs = {}
+
+
+def nation_config(nation):
+    """
+    Returns the settings of a nation in NATIONS, e.g. "scotland", or of a nation and year from job_key().
+    """
+    if nation in NATIONS:
+        return NATIONS[nation]
+    if nation in _year_configs:
+        return _year_configs[nation]
+    raise ValueError(f"Nation must be one of {list(NATIONS)}, not {nation!r}")
+
+
+def job_key(nation, year=YEAR):
+    """
+    Returns the key the pipeline functions take for a nation's data of a year: the nation itself for YEAR,
+    otherwise e.g. "scotland_2021", whose settings are the nation's updated with NATION_YEARS[nation][year].
+    Stage names, stores and plots are named after the key, so each year is built and cached on its own.
+    """
+    config = nation_config(nation)
+    if year == YEAR:
+        return nation
+    if year not in NATION_YEARS.get(nation, {}):
+        raise ValueError(
+            f"No settings for {nation} in {year}; add the urls of its data to NATION_YEARS or a settings file"
+        )
+    key = f"{nation}_{year}"
+    _year_configs[key] = {
+        **config,
+        **NATION_YEARS[nation][year],
+        "nation": nation,
+        "year": year,
+    }
+    return key
+
+
+def nation_year(nation):
+    """
+    Returns the nation and year of the data a key from job_key() refers to, e.g. ("scotland", 2021).
+    """
+    config = nation_config(nation)
+    return config.get("nation", nation), config.get("year", YEAR)
+
+
+def load_year_settings(path):
+    """
+    Reads settings by nation and year from a json file, e.g. {"scotland": {"2021": {"prescribing_urls": [...]}}},
+    into NATION_YEARS; settings for YEAR update NATIONS itself.
+    """
+    with open(path) as settings_file:
+        settings = json.load(settings_file)
+    for nation, years in settings.items():
+        nation_config(nation)
+        for year, year_settings in years.items():
+            if int(year) == YEAR:
+                NATIONS[nation].update(year_settings)
+            else:
+                NATION_YEARS[nation][int(year)] = year_settings
+
+
+def check_nation(nation):
+    """
+    Checks a nation's settings without touching the network or the data: required settings are present,
+    the prescribing columns map onto practice, description and items, and GP postcodes have a source.
+    Returns a list of problems, empty if the settings are complete.
+    """
+    config = nation_config(nation)
+    problems = [f"missing {key}" for key in REQUIRED_SETTINGS if key not in config]
+    columns = config.get("prescribing_columns", {})
+    if sorted(columns.values()) != ["description", "items", "practice"]:
+        problems.append(
+            "prescribing_columns must map to practice, description and items"
+        )
+    if set(config.get("prescribing_dtypes", {})) != set(columns):
+        problems.append("prescribing_dtypes must name the prescribing_columns")
+    if config.get("zip_members") is None:
+        gp_settings = ["gp_details_urls", "gp_details_practice_column"]
+    else:
+        gp_settings = ["gp_list_url", "address_practice_column"]
+    problems += [f"missing {key}" for key in gp_settings if key not in config]
+    return problems
+
+
+def prescribing_column(nation, name):
+    """
+    Returns the nation's own name of a normalised prescribing column: "practice", "description" or "items".
+    """
+    columns = nation_config(nation)["prescribing_columns"]
+    return next(column for column, normalised in columns.items() if normalised == name)
+
+
+def gp_scores_file(nation):
+    """
+    Name of the loneliness scores by GP postcode in inst/extdata/, built by preproc.py and used as input by scoring.py.
+    """
+    nation, year = nation_year(nation)
+    return f"{nation}_gp_{year}.csv"
+
+
+def zone_scores_file(nation):
+    """
+    Name of the loneliness scores, ranks and deciles by zone in inst/extdata/, built by scoring.py.
+    Years other than YEAR end in the year, e.g. scotland_clinical_loneliness_dz_2021.csv.
+    """
+    zone = nation_config(nation)["zone"]
+    nation, year = nation_year(nation)
+    if year == YEAR:
+        return f"{nation}_clinical_loneliness_{zone}.csv"
+    return f"{nation}_clinical_loneliness_{zone}_{year}.csv"
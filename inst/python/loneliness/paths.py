@@ -0,0 +1,18 @@
+import os
+
+# Root of the repository, found from the package location so the pipeline runs from any working directory
+REPO_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, os.pardir)
+)
+
+# Inputs, downloads, caches and outputs all live under inst/extdata; LONELINESS_EXTDATA points them elsewhere
+EXTDATA_PATH = os.environ.get(
+    "LONELINESS_EXTDATA", os.path.join(REPO_PATH, "inst", "extdata")
+)
+
+
+def extdata_path(*parts):
+    """
+    Returns the path of a file or folder under EXTDATA_PATH.
+    """
+    return os.path.join(EXTDATA_PATH, *parts)
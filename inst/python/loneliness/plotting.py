@@ -0,0 +1,129 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from .paths import extdata_path
+
+# How diagnostic plots are handled: "show" displays them (blocking), "png" writes them to PLOT_DIR in the background,
+# "off" skips them without importing matplotlib. Set with set_plot_mode() (as the --headless and --plots-png flags of
+# cli.py do) or the LONELINESS_PLOTS environment variable
+PLOT_MODES = ("show", "png", "off")
+PLOT_DIR = os.environ.get("LONELINESS_PLOT_DIR", extdata_path("plots"))
+
+_mode = None
+_executor = None
+
+
+def set_plot_mode(mode):
+    """
+    Sets the plot mode for the rest of the run, overriding the environment.
+    """
+    global _mode
+    if mode not in PLOT_MODES:
+        raise ValueError(f"Plot mode must be one of {PLOT_MODES}, not {mode!r}")
+    _mode = mode
+
+
+def plot_mode():
+    """
+    Returns the current plot mode, from set_plot_mode() or LONELINESS_PLOTS (default "show").
+    """
+    if _mode is not None:
+        return _mode
+    mode = os.environ.get("LONELINESS_PLOTS", "show")
+    if mode not in PLOT_MODES:
+        raise ValueError(f"LONELINESS_PLOTS must be one of {PLOT_MODES}, not {mode!r}")
+    return mode
+
+
+def _pyplot(backend=None):
+    """
+    Imports matplotlib on first use only, so runs without plots never load it.
+    """
+    import matplotlib
+
+    if backend is not None:
+        matplotlib.use(backend)
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+def _write_png(name, draw, args, kwargs):
+    """
+    Draws a figure with the non-interactive Agg backend and saves it as PLOT_DIR/<name>.png.
+    """
+    plt = _pyplot("Agg")
+    draw(plt, *args, **kwargs)
+    os.makedirs(PLOT_DIR, exist_ok=True)
+    path = os.path.join(PLOT_DIR, f"{name}.png")
+    plt.savefig(path, dpi=150, bbox_inches="tight")
+    plt.close("all")
+    print(f"Plot saved to {path}")
+    return path
+
+
+def plot(name, draw, *args, **kwargs):
+    """
+    Draws a diagnostic figure with draw(plt, *args, **kwargs) according to the plot mode: shown with plt.show(),
+    written to PLOT_DIR/<name>.png by a background thread while the pipeline carries on, or skipped.
+    Data passed in args is copied before it is handed to the background thread.
+    """
+    mode = plot_mode()
+    if mode == "off":
+        return None
+    if mode == "show":
+        plt = _pyplot()
+        draw(plt, *args, **kwargs)
+        plt.show()
+        return None
+
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1)
+    args = [arg.copy() if hasattr(arg, "copy") else arg for arg in args]
+    return _executor.submit(_write_png, name, draw, args, kwargs)
+
+
+def wait_for_plots():
+    """
+    Waits for any PNGs still being written in the background.
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def histogram(plt, values, figsize=(5, 3), title=None):
+    """
+    Histogram of a score column, to check it is normally distributed.
+    """
+    values.hist(bins=100, figsize=figsize)
+    if title is not None:
+        plt.title(title)
+
+
+def gp_score_map(plt, gp_geo, title=None):
+    """
+    Map of loneliness scores by GP surgery, shaded by quantile.
+    """
+    gp_geo.plot(
+        column="loneliness_zscore", scheme="quantiles", cmap="Blues", marker="."
+    )
+    if title is not None:
+        plt.title(title)
+
+
+def decile_map(plt, coords, title, reverse=False):
+    """
+    Map of zones coloured by loneliness decile.
+    """
+    import matplotlib.cm as cm
+
+    # Generate colours based on number of decile values
+    cmap = cm.get_cmap("YlGn", len(coords["deciles"].unique()))
+    if reverse:
+        cmap = cmap.reversed()
+    fig, ax = plt.subplots(figsize=(5, 7))
+    ax.axis("off")
+    coords.plot(column="deciles", ax=ax, cmap=cmap, legend=True)
+    plt.title(title)
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import zipfile
+import requests
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from .instrumentation import count_download
+from .paths import extdata_path
+
+# National Statistics Postcode Lookup (NSPL) download and the csv inside it
+NSPL_URL = "https://www.arcgis.com/sharing/rest/content/items/9ac0331178b0435e839f62f41cc61c16/data"
+NSPL_MEMBER = "Data/NSPL_MAY_2022_UK.csv"
+
+# Local postcode table extracted from the NSPL, named after the NSPL release
+POSTCODE_TABLE_PATH = extdata_path("nspl", "NSPL_MAY_2022_UK.parquet")
+
+# Columns kept from the NSPL; coordinates are blank for some postcodes
+NSPL_DTYPES = {
+    "pcds": str,
+    "oseast1m": "Int32",
+    "osnrth1m": "Int32",
+    "lsoa11": str,
+    "msoa11": str,
+}
+
+# Small row groups let postcode filters skip most of the sorted table
+ROW_GROUP_SIZE = 16_384
+
+
+def normalise_postcodes(postcodes):
+    """
+    Upper cases postcodes and removes all whitespace, e.g. "ab10 1nw" -> "AB101NW".
+    """
+    return (
+        pd.Series(postcodes, dtype="string")
+        .str.upper()
+        .str.replace(r"\s+", "", regex=True)
+    )
+
+
+def build_postcode_table(
+    url=NSPL_URL, member=NSPL_MEMBER, table_path=POSTCODE_TABLE_PATH
+):
+    """
+    Downloads the NSPL once and extracts the postcode, easting, northing, lsoa11 and msoa11 columns into a Parquet
+    table sorted on the normalised postcode, so later lookups only read the row groups holding the wanted postcodes.
+    Returns the path of the table.
+    """
+    print("Downloading NSPL...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        zip_path = os.path.join(temp_dir, "nspl.zip")
+        with requests.get(url, stream=True, timeout=600) as response:
+            response.raise_for_status()
+            with open(zip_path, "wb") as zip_file:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    zip_file.write(chunk)
+                    count_download(len(chunk))
+        with zipfile.ZipFile(zip_path, "r") as zip_file:
+            with zip_file.open(member) as csv_file:
+                nspl = pd.read_csv(
+                    csv_file, usecols=list(NSPL_DTYPES), dtype=NSPL_DTYPES
+                )
+
+    nspl["pcds"] = normalise_postcodes(nspl["pcds"])
+    nspl = nspl.sort_values("pcds", ignore_index=True)
+
+    os.makedirs(os.path.dirname(table_path), exist_ok=True)
+    pq.write_table(
+        pa.Table.from_pandas(nspl, preserve_index=False),
+        table_path + ".tmp",
+        row_group_size=ROW_GROUP_SIZE,
+        compression="zstd",
+    )
+    os.replace(table_path + ".tmp", table_path)
+    print(f"{len(nspl)} NSPL postcodes saved to {table_path}")
+    return table_path
+
+
+def lookup_postcodes(
+    postcodes, table_path=POSTCODE_TABLE_PATH, url=NSPL_URL, member=NSPL_MEMBER
+):
+    """
+    Returns the NSPL rows (pcds, oseast1m, osnrth1m, lsoa11, msoa11) of the given postcodes, matched after normalising.
+    Only the row groups of the sorted local postcode table whose postcode range holds a wanted postcode are read,
+    building the table on first use. Postcodes not in the NSPL are absent from the result.
+    """
+    if not os.path.exists(table_path):
+        build_postcode_table(url, member, table_path)
+
+    wanted = np.sort(normalise_postcodes(postcodes).dropna().unique().to_numpy())
+
+    # Use the postcode min/max statistics of each row group to find those that can hold a wanted postcode
+    parquet_file = pq.ParquetFile(table_path)
+    pcds_index = parquet_file.schema_arrow.get_field_index("pcds")
+    row_groups = []
+    for row_group in range(parquet_file.metadata.num_row_groups):
+        statistics = (
+            parquet_file.metadata.row_group(row_group).column(pcds_index).statistics
+        )
+        first = np.searchsorted(wanted, statistics.min, side="left")
+        last = np.searchsorted(wanted, statistics.max, side="right")
+        if last > first:
+            row_groups.append(row_group)
+
+    nspl = parquet_file.read_row_groups(row_groups)
+    nspl = nspl.filter(pc.is_in(nspl["pcds"], value_set=pa.array(wanted, pa.string())))
+    return nspl.to_pandas().astype({"oseast1m": "float64", "osnrth1m": "float64"})
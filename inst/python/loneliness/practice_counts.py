@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+# Per-practice prescription counts held compactly: the counts as one contiguous 2D uint32 array of practices x count
+# columns (items, then one per illness), and the practice codes as a categorical
+# Counts are summed with numpy over the practice codes, so string columns are never summed by a groupby
+
+# Dtype of the counts; a year of one practice's items is far below its limit of 4.29 billion
+COUNT_DTYPE = "uint32"
+
+
+def sum_rows(codes, counts, n_groups):
+    """
+    Sums the rows of counts, a 2D array, that share a group code from 0 to n_groups - 1; rows with code -1 are skipped.
+    Returns a uint32 array of n_groups x the columns of counts.
+    """
+    keep = codes >= 0
+    codes = codes[keep]
+    counts = np.asarray(counts)[keep]
+    totals = np.empty((n_groups, counts.shape[1]), dtype=COUNT_DTYPE)
+    # bincount sums in float64, exact for counts below 2**53
+    for column in range(counts.shape[1]):
+        totals[:, column] = np.bincount(
+            codes, weights=counts[:, column], minlength=n_groups
+        )
+    return totals
+
+
+def practice_counts(practices, counts, columns, key):
+    """
+    Returns a dataframe of the practice codes as a categorical column named key, followed by counts, a 2D array of
+    practices x columns, as a single uint32 block.
+    """
+    frame = pd.DataFrame(
+        np.ascontiguousarray(counts, dtype=COUNT_DTYPE), columns=list(columns)
+    )
+    frame.insert(0, key, pd.Categorical(practices))
+    return frame
+
+
+def sum_practice_counts(frame, key, columns):
+    """
+    Sums the count columns of frame by key, e.g. the practice code or the postcode, in one pass over a 2D array.
+    Any other column, e.g. a practice's postcode, is taken from the first row of each key and never summed.
+    Returns one row per key, sorted by key, laid out as practice_counts() with the other columns after the counts.
+    """
+    codes, keys = pd.factorize(np.asarray(frame[key]), sort=True)
+    summary = practice_counts(
+        keys, sum_rows(codes, frame[columns].to_numpy(), len(keys)), columns, key
+    )
+
+    other = [
+        column for column in frame.columns if column != key and column not in columns
+    ]
+    if other:
+        rows = np.flatnonzero(codes >= 0)
+        first = rows[np.unique(codes[rows], return_index=True)[1]]
+        summary = pd.concat(
+            [summary, frame[other].iloc[first].reset_index(drop=True)], axis=1
+        )
+    return summary
@@ -0,0 +1,553 @@
+import os
+from functools import partial
+import pandas as pd
+from .nations import (
+    CONDITION_CACHE_FILE,
+    DRUG_LIST_FILE,
+    gp_scores_file,
+    nation_config,
+    prescribing_column,
+)
+from .paths import extdata_path
+from .plotting import plot, histogram
+from .practice_counts import practice_counts, sum_practice_counts
+from .prescribing_reader import CHUNKSIZE
+
+# Prescription preprocessing shared by scotland, wales and ni; builds inst/extdata/<nation>_gp_2022.csv for scoring.py
+# Modules that load pyarrow or requests are imported by the functions that use them, keeping imports fast
+
+# Settings of a nation that the monthly practice x drug matrices are read with; changing any reprocesses every month
+MONTH_SETTINGS = [
+    "prescribing_dtypes",
+    "prescribing_columns",
+    "read_kwargs",
+    "zip_members",
+    "address_practice_column",
+]
+
+_condition_matcher = None
+
+
+def load_condition_matcher():
+    """
+    Loads the conditions associated with loneliness and their respective medications from drug_list.csv on first use,
+    compiled into a ConditionMatcher that labels each prescription in one pass.
+    Classifications are persisted in a cache shared by the scotland, wales and ni pipelines.
+    """
+    global _condition_matcher
+    if _condition_matcher is None:
+        from .condition_matcher import ConditionMatcher
+
+        loneliness_conditions_drugs = pd.read_csv(extdata_path(DRUG_LIST_FILE))
+        _condition_matcher = ConditionMatcher(
+            loneliness_conditions_drugs, cache_path=extdata_path(CONDITION_CACHE_FILE)
+        )
+    return _condition_matcher
+
+
+def code_condition(nation, df):
+    """
+    Takes in a nation's prescribing dataframe and identifies loneliness related conditions based on prescription.
+    Outputs a dataframe that multiplies loneliness related prescriptions by its count.
+    """
+    out = load_condition_matcher().flags(df[prescribing_column(nation, "description")])
+    return out.multiply(df[prescribing_column(nation, "items")], axis=0)
+
+
+def count_partition(nation, partition, chunksize=CHUNKSIZE):
+    """
+    Streams one month of the Parquet store in chunks of chunksize rows and sums the items prescribed by practice and drug.
+    Returns the month's PracticeDrugMatrix (see drug_matrix.py).
+    """
+    from .drug_matrix import combine_matrices, count_matrix
+    from .prescribing_store import read_partition_in_chunks
+
+    config = nation_config(nation)
+    practice = prescribing_column(nation, "practice")
+    description = prescribing_column(nation, "description")
+    items = prescribing_column(nation, "items")
+
+    # Descriptions are read as a categorical, whose codes index the drugs of each chunk
+    chunk_matrices = [
+        count_matrix(prescribe[practice], prescribe[description], prescribe[items])
+        for prescribe in read_partition_in_chunks(
+            partition, config["prescribing_columns"], chunksize=chunksize
+        )
+    ]
+    return combine_matrices(chunk_matrices)
+
+
+def summarise_month(nation, file_path, chunksize=CHUNKSIZE):
+    """
+    Streams one month of prescribing data in chunks of chunksize rows and sums the items prescribed by practice and drug.
+    The downloaded csv is converted once into the Parquet store by ingest_month(); later runs read only the store.
+    Only the practice, description and items columns are read, in compact dtypes, so peak memory is bounded by chunksize.
+    Zipped months (wales) also hold the GP addresses, which are joined to give each practice its postcode.
+    Returns the month's PracticeDrugMatrix.
+    Runs in a worker process when count_condition() is called with workers > 1.
+    """
+    from .prescribing_store import ingest_month
+
+    config = nation_config(nation)
+    if config["zip_members"] is not None:
+        return summarise_zipped_month(nation, file_path, chunksize)
+
+    # Convert the month into the Parquet store on first use, then read it back with column projection
+    partition = ingest_month(
+        file_path,
+        nation,
+        config["prescribing_columns"],
+        config["prescribing_dtypes"],
+        chunksize=chunksize,
+        **config["read_kwargs"],
+    )
+    print(f" Proccessing {os.path.basename(file_path)}")
+    drug_matrix = count_partition(nation, partition, chunksize)
+    print(f" Completed processing {os.path.basename(file_path)}")
+    return drug_matrix
+
+
+def summarise_zipped_month(nation, file_path, chunksize=CHUNKSIZE):
+    """
+    Streams one month of a prescribing zip folder in chunks of chunksize rows, sums the items prescribed by practice
+    and drug and joins GP postcodes from the address file in the folder.
+    The prescribing csv is converted once into the Parquet store by ingest_month(); later runs read only the store.
+    Returns the month's PracticeDrugMatrix of the practices in the address file, with their postcodes.
+    """
+    import zipfile as zp
+    from .prescribing_store import ingest_month
+
+    config = nation_config(nation)
+    members = config["zip_members"]
+    address_practice = config["address_practice_column"]
+
+    with zp.ZipFile(file_path) as zipf:
+        zip_names = zipf.namelist()
+
+        # Preprocess prescribing files
+        prescribe_name = next(
+            (filename for filename in zip_names if members["prescribing"] in filename),
+            None,
+        )
+        # Convert the month into the Parquet store on first use, then read it back with column projection
+        partition = ingest_month(
+            file_path,
+            nation,
+            config["prescribing_columns"],
+            config["prescribing_dtypes"],
+            source=lambda: zipf.open(prescribe_name),
+            chunksize=chunksize,
+            **config["read_kwargs"],
+        )
+        drug_matrix = count_partition(nation, partition, chunksize)
+
+        # Preprocess address files
+        addr_name = next(
+            (filename for filename in zip_names if members["address"] in filename),
+            None,
+        )
+        addr = pd.read_csv(zipf.open(addr_name))
+        addr = addr[[address_practice, "Postcode"]]
+
+    # Join each practice's postcode from the address files, keeping practices with an address
+    postcodes = addr.drop_duplicates(address_practice).set_index(address_practice)[
+        "Postcode"
+    ]
+    del addr
+    address_row = postcodes.index.get_indexer(drug_matrix.practices.astype(str))
+    has_address = address_row >= 0
+    drug_matrix = drug_matrix.select(
+        has_address, postcodes.to_numpy()[address_row[has_address]]
+    )
+
+    print(
+        f" Completed counting prescription and joining postcodes for {os.path.basename(file_path)}"
+    )
+    return drug_matrix
+
+
+def count_columns(nation):
+    """
+    Names of the count columns of the per-practice summaries: the items prescribed, then the items for each illness.
+    """
+    return [prescribing_column(nation, "items"), *load_condition_matcher().illnesses]
+
+
+def download_prescribing(nation):
+    """
+    Downloads each month of the nation's prescribing data into inst/extdata/pitc_<nation>/, skipping files whose ETag
+    or size is unchanged at the source, so it is cheap to run on every build.
+    Returns the name, size and modification time of each file as downloaded, which changes when a month is revised.
+    """
+    from .downloader import download_files
+
+    config = nation_config(nation)
+    destination_folder = extdata_path(config["prescribing_folder"])
+    files = download_files(config["prescribing_urls"], destination_folder)
+    return [
+        {
+            "file": os.path.basename(file_path),
+            "size": os.path.getsize(file_path),
+            "mtime_ns": os.stat(file_path).st_mtime_ns,
+        }
+        for file_path in files
+    ]
+
+
+def count_drugs(nation, files=None, workers=1, chunksize=CHUNKSIZE, window=None):
+    """
+    Iterates over the monthly prescribing data to sum the items prescribed over the year by GP practice and drug
+    (distinct description), as a sparse PracticeDrugMatrix; for zipped months (wales) it holds GP postcodes.
+    files are the months from download_prescribing(), which is run if they are not given.
+    Runs summarise_month().
+    workers > 1 processes the months in parallel in a process pool; only the sparse per-month matrices are returned.
+    chunksize sets the number of rows streamed at a time from each monthly file.
+    Per-month matrices are persisted, so a rebuild only processes months that are new or changed;
+    they do not depend on drug_list.csv, which count_condition() applies.
+    window keeps only the latest window months (e.g. 12 for a rolling year), evicting older ones.
+    """
+    from .drug_matrix import combine_matrices
+    from .monthly_summaries import update_monthly_summaries
+
+    config = nation_config(nation)
+    if files is None:
+        files = download_prescribing(nation)
+    destination_folder = extdata_path(config["prescribing_folder"])
+
+    # Iterate over each monthly file to count prescriptions
+    # Only months that are new or changed since the last run are processed; the rest are read from stored matrices
+    monthly_data = update_monthly_summaries(
+        [os.path.join(destination_folder, month["file"]) for month in files],
+        nation,
+        partial(summarise_month, nation),
+        workers=workers,
+        chunksize=chunksize,
+        window=window,
+        settings={key: config.get(key) for key in MONTH_SETTINGS},
+    )
+
+    # Add the months together
+    drug_matrix = combine_matrices(monthly_data)
+    print(
+        f"All PITC monthly data successfully combined, {drug_matrix.shape[0]} practices by {drug_matrix.shape[1]} drugs"
+    )
+    return drug_matrix
+
+
+def count_condition(
+    nation, drug_matrix=None, workers=1, chunksize=CHUNKSIZE, window=None
+):
+    """
+    Outputs an aggregated dataframe that sums number of prescriptions by illness type over the year, grouped by
+    GP practice: the practice x drug matrix from count_drugs() (run with workers, chunksize and window if drug_matrix
+    is not given) is multiplied by the drug x illness indicator matrix of drug_list.csv.
+    Counts are uint32 and practice codes categorical (see practice_counts.py); no string column is ever summed.
+    For zipped months (wales) the GP postcodes are added.
+    """
+    if drug_matrix is None:
+        drug_matrix = count_drugs(
+            nation, workers=workers, chunksize=chunksize, window=window
+        )
+
+    monthly_prescriptions = practice_counts(
+        drug_matrix.practices,
+        drug_matrix.count_array(load_condition_matcher()),
+        count_columns(nation),
+        prescribing_column(nation, "practice"),
+    )
+    if drug_matrix.postcodes is not None:
+        # Create uniform postcode field
+        monthly_prescriptions["Postcode"] = drug_matrix.postcodes
+        monthly_prescriptions["pcstrip"] = monthly_prescriptions[
+            "Postcode"
+        ].str.replace(" ", "")
+    print(
+        f"Prescriptions counted by illness, length of df {len(monthly_prescriptions)}"
+    )
+
+    return monthly_prescriptions
+
+
+def add_postcode(nation, monthly_prescriptions):
+    """
+    Iterates over quarterly GP contact details files and combines them.
+    Takes in the df output from count_condition().
+    Joins this with the GP contact details to output a df with prescription details that is summed by postcodes.
+    Used by nations whose GP postcodes come from contact details files (scotland, ni).
+    """
+    from .downloader import download_files
+
+    config = nation_config(nation)
+    practice = prescribing_column(nation, "practice")
+
+    # Download GP contact details data into inst/extdata/gp_details_<nation>/ folder
+    destination_folder = extdata_path(config["gp_details_folder"])
+    gp_files = download_files(config["gp_details_urls"], destination_folder)
+
+    # Iterate over GP files and combine them
+    gp_combine = []
+    for file_path in gp_files:
+        gp_data = pd.read_csv(file_path)
+        gp_data = gp_data.rename(
+            columns={config["gp_details_practice_column"]: practice}
+        )
+        gp_combine.append(gp_data[[practice, "Postcode"]])
+    gp_data = pd.concat(gp_combine, ignore_index=True)
+    print(f"GP contact details processed. Shape {gp_data.shape}")
+
+    # Drop duplicates as contact details will be repeated across quarters
+    gp_data = gp_data.drop_duplicates()
+
+    # Subset monthly prescription data with GP practices that appear in the gp_data df as
+    # monthly_prescription includes non GP practices e.g. pharamcies
+    gp_ids = gp_data[practice].unique()
+    monthly_prescriptions = monthly_prescriptions[
+        monthly_prescriptions[practice].isin(gp_ids)
+    ].copy()
+    print(
+        f"Shape of monthly_prescription once subsetted with GPs only: {monthly_prescriptions.shape}"
+    )
+
+    # Join GP details to prescription data, on the categorical practice codes
+    gp_data[practice] = gp_data[practice].astype(monthly_prescriptions[practice].dtype)
+    monthly_prescriptions_postcodes = monthly_prescriptions.merge(
+        gp_data, how="left", on=practice
+    )
+    monthly_prescriptions_postcodes["pcstrip"] = monthly_prescriptions_postcodes[
+        "Postcode"
+    ].str.replace(" ", "")
+
+    # Sum values by postcode, to get the total prescriptions across the year
+    # The practice code and postcode are taken from the first row of each postcode rather than summed
+    monthly_prescriptions_postcodes = sum_practice_counts(
+        monthly_prescriptions_postcodes, "pcstrip", count_columns(nation)
+    )
+
+    # Drop second instance of the GP practices with two postcodes asigned to them
+    monthly_prescriptions_postcodes = monthly_prescriptions_postcodes[
+        ~monthly_prescriptions_postcodes.duplicated(subset=practice, keep="first")
+        | ~monthly_prescriptions_postcodes[practice].isin(
+            config["duplicate_postcode_practices"]
+        )
+    ]
+    monthly_prescriptions_postcodes = monthly_prescriptions_postcodes.drop(
+        columns=["Postcode", practice]
+    )
+    print(
+        f"Postcodes added to monthly prescriptions. Number of  postcodes in merged df {len(monthly_prescriptions_postcodes)}"
+    )
+    return monthly_prescriptions_postcodes
+
+
+def subset_gps(nation, monthly_prescriptions):
+    """
+    Downloads list of GP codes and subsets the df output from count_condition() to include GPs only (excluding for e.g. pharmacies).
+    Used by nations whose GP postcodes come with the prescribing data (wales).
+    """
+    from .downloader import download_file
+
+    config = nation_config(nation)
+    practice = prescribing_column(nation, "practice")
+
+    # Download list of GPs into inst/extdata/gp_details_<nation>/ folder
+    destination_folder = extdata_path(config["gp_details_folder"])
+    os.makedirs(
+        destination_folder, exist_ok=True
+    )  # Create the destination folder if it doesn't exist
+    file_path = download_file(config["gp_list_url"], destination_folder)
+    if file_path is None:
+        print("Failed to download list of GPs")
+
+    gp = pd.read_excel(file_path)
+    gp_ids = gp[practice].unique()
+    prescriptions_gp = monthly_prescriptions[
+        monthly_prescriptions[practice].isin(gp_ids)
+    ]
+    print(
+        f" Does length of the df equal unique number of practices? {len(prescriptions_gp) == gp[practice].nunique()}"
+    )
+
+    return prescriptions_gp
+
+
+def illness_percentage(nation, monthly_prescriptions_postcodes):
+    """
+    Creates columns in the DF per illness that is the percentage of drugs prescribed out of total drugs prescribed
+    """
+    perc_cols = pd.Index(load_condition_matcher().illnesses)
+    target_cols = perc_cols + "_perc"
+    # Percentages for discrete illness groups out of total drugs prescribed
+    monthly_prescriptions_postcodes[target_cols] = (
+        monthly_prescriptions_postcodes[perc_cols].divide(
+            monthly_prescriptions_postcodes[prescribing_column(nation, "items")],
+            axis=0,
+        )
+        * 100
+    )
+    print("Percentage calculations added")
+    monthly_prescriptions_perc = monthly_prescriptions_postcodes
+
+    return monthly_prescriptions_perc
+
+
+def standardise(nation, monthly_prescriptions_perc, weights=None, robust=False):
+    """
+    Calculates the z-score of each illness' percentage to standardise prescriptions relative to other practices,
+    and sums the z-scores into a loneliness score, for every illness in drug_list.csv in one matrix operation.
+    weights maps illnesses to the weight of their z-score in the sum; illnesses not named keep a weight of 1.
+    robust=True standardises with the median and median absolute deviation instead of the mean and standard deviation.
+    Returns a df of the loneliness score by postcode.
+    """
+    from .standardisation import composite_scores
+
+    illnesses = load_condition_matcher().illnesses
+    if weights is not None:
+        unknown = set(weights) - set(illnesses)
+        if unknown:
+            raise ValueError(
+                f"Weights given for illnesses not in {DRUG_LIST_FILE}: {sorted(unknown)}"
+            )
+        weights = [weights.get(illness, 1) for illness in illnesses]
+
+    # Z-scores of every illness and their weighted sum, without adding a column per illness to the df
+    perc_cols = [f"{illness}_perc" for illness in illnesses]
+    loneliness_postcode = pd.DataFrame(
+        {
+            "postcode": monthly_prescriptions_perc["pcstrip"],
+            "loneliness_zscore": composite_scores(
+                monthly_prescriptions_perc[perc_cols].to_numpy(),
+                weights=weights,
+                robust=robust,
+            ),
+        }
+    )
+    plot(
+        f"{nation}_gp_scores_histogram",
+        histogram,
+        loneliness_postcode["loneliness_zscore"],
+        figsize=(5, 2),
+    )
+    print(f"Loneliness z score added, shape of df {loneliness_postcode.shape}")
+    return loneliness_postcode
+
+
+def save_dataframe(nation, loneliness_postcode):
+    """
+    Saves dataframe in extdata/ as csv
+    """
+    loneliness_postcode.to_csv(extdata_path(gp_scores_file(nation)), index=False)
+    print("Dataset saved as csv")
+
+
+def add_preproc_stages(
+    runner,
+    nation,
+    workers=1,
+    chunksize=CHUNKSIZE,
+    window=None,
+    weights=None,
+    robust=False,
+):
+    """
+    Adds the stages of build_preproc() for a nation to a StageRunner from stages.py and returns the name of the last.
+    Each stage is fingerprinted on the nation settings it reads, so e.g. changing the IDW settings leaves them cached.
+    download_prescribing() runs on every build, so count_drugs() aggregates again when a month is revised at the source
+    as well as when its settings change; a change to drug_list.csv only reruns count_condition() onwards, applying the
+    new drug list to the stored practice x drug matrix.
+    """
+    from .stages import file_hash
+
+    config = nation_config(nation)
+    drug_list = file_hash(extdata_path(DRUG_LIST_FILE))
+
+    # Checking the downloads costs a request per month, so it is run every time and count_drugs() depends on its output
+    prescribing_files = runner.add(
+        f"{nation}/download_prescribing",
+        download_prescribing,
+        params={"nation": nation},
+        depends={"prescribing_urls": config["prescribing_urls"]},
+        always_run=True,
+    )
+    drug_matrix = runner.add(
+        f"{nation}/count_drugs",
+        count_drugs,
+        inputs={"files": prescribing_files},
+        params={"nation": nation, "window": window},
+        options={"workers": workers, "chunksize": chunksize},
+        depends={
+            "settings": {
+                key: config.get(key) for key in ["prescribing_folder", *MONTH_SETTINGS]
+            },
+        },
+    )
+    monthly_prescriptions = runner.add(
+        f"{nation}/count_condition",
+        count_condition,
+        inputs={"drug_matrix": drug_matrix},
+        params={"nation": nation},
+        depends={"drug_list": drug_list},
+    )
+    if config["zip_members"] is not None:
+        monthly_prescriptions_postcodes = runner.add(
+            f"{nation}/subset_gps",
+            subset_gps,
+            inputs={"monthly_prescriptions": monthly_prescriptions},
+            params={"nation": nation},
+            depends={"gp_list_url": config["gp_list_url"]},
+        )
+    else:
+        monthly_prescriptions_postcodes = runner.add(
+            f"{nation}/add_postcode",
+            add_postcode,
+            inputs={"monthly_prescriptions": monthly_prescriptions},
+            params={"nation": nation},
+            depends={
+                key: config[key]
+                for key in [
+                    "gp_details_urls",
+                    "gp_details_practice_column",
+                    "duplicate_postcode_practices",
+                ]
+            },
+        )
+    monthly_prescriptions_perc = runner.add(
+        f"{nation}/illness_percentage",
+        illness_percentage,
+        inputs={"monthly_prescriptions_postcodes": monthly_prescriptions_postcodes},
+        params={"nation": nation},
+        depends={"drug_list": drug_list},
+    )
+    return runner.add(
+        f"{nation}/standardise",
+        standardise,
+        inputs={"monthly_prescriptions_perc": monthly_prescriptions_perc},
+        params={"nation": nation, "weights": weights, "robust": robust},
+        depends={"drug_list": drug_list},
+    )
+
+
+def build_preproc(
+    nation, workers=1, window=None, weights=None, robust=False, runner=None
+):
+    """
+    Runs all functions required to build and save the pre-processed <nation>_gp_2022.csv in inst/extdata/.
+    To be used as an input for build_idw() in scoring.py.
+    workers and window are passed to count_condition() to process months in parallel and keep a rolling window of months.
+    weights and robust are passed to standardise() to weight illnesses and use the median and MAD.
+    The functions run as stages of runner (a new StageRunner if not given), skipping those whose inputs are unchanged.
+    """
+    from .stages import StageRunner
+
+    if runner is None:
+        runner = StageRunner()
+    loneliness_postcode = runner.get(
+        add_preproc_stages(
+            runner,
+            nation,
+            workers=workers,
+            window=window,
+            weights=weights,
+            robust=robust,
+        )
+    )
+    save_dataframe(nation, loneliness_postcode)
@@ -0,0 +1,47 @@
+import pandas as pd
+
+# Default number of rows read at a time from a monthly prescribing file; bounds peak memory
+CHUNKSIZE = 500_000
+
+
+def _read_csv(source, **read_kwargs):
+    """
+    Reads a csv from a path, or from a function returning a fresh file object (e.g. lambda: zipf.open(name)).
+    """
+    if callable(source):
+        with source() as file:
+            return pd.read_csv(file, **read_kwargs)
+    return pd.read_csv(source, **read_kwargs)
+
+
+def read_columns_in_chunks(source, dtypes, chunksize=CHUNKSIZE, **read_kwargs):
+    """
+    Streams only the columns named in dtypes from a prescribing csv, parsed straight into the given compact dtypes.
+    Source is a path, or a function returning a fresh file object such as a zip member.
+    Header names are matched after stripping whitespace and chunks are yielded with the stripped names.
+    chunksize=None reads the whole file as a single chunk.
+    """
+    # Map stripped column names to the names as they appear in the file
+    header = _read_csv(source, nrows=0, **read_kwargs).columns
+    raw_names = {column.strip(): column for column in header}
+    usecols = [raw_names[column] for column in dtypes]
+    raw_dtypes = {raw_names[column]: dtype for column, dtype in dtypes.items()}
+
+    if chunksize is None:
+        chunks = [_read_csv(source, usecols=usecols, dtype=raw_dtypes, **read_kwargs)]
+        file = None
+    else:
+        file = source() if callable(source) else source
+        chunks = pd.read_csv(
+            file, usecols=usecols, dtype=raw_dtypes, chunksize=chunksize, **read_kwargs
+        )
+
+    try:
+        for chunk in chunks:
+            chunk.columns = chunk.columns.str.strip()
+            yield chunk[list(dtypes)]
+    finally:
+        if chunksize is not None:
+            chunks.close()
+        if callable(source) and file is not None:
+            file.close()
@@ -0,0 +1,161 @@
+import os
+import re
+import json
+import hashlib
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from .paths import extdata_path
+from .prescribing_reader import CHUNKSIZE, read_columns_in_chunks
+
+# Columnar store of the monthly prescribing data, partitioned as nation=<nation>/month=<YYYY-MM>/
+STORE_PATH = extdata_path("prescribing_store")
+
+# Key of the Parquet metadata recording the settings a partition was converted with
+INGEST_HASH_KEY = b"loneliness_ingest_hash"
+
+MONTHS = [
+    "january",
+    "february",
+    "march",
+    "april",
+    "may",
+    "june",
+    "july",
+    "august",
+    "september",
+    "october",
+    "november",
+    "december",
+]
+
+
+def month_key(file_path):
+    """
+    Derives a YYYY-MM month from a downloaded file name, e.g. pitc202212.csv or gp-data-extract-december-2022.
+    Falls back to the file name itself if no month can be found.
+    """
+    filename = os.path.basename(file_path).lower()
+    numeric = re.search(r"(20\d{2})(0[1-9]|1[0-2])", filename)
+    if numeric:
+        return f"{numeric.group(1)}-{numeric.group(2)}"
+    named = re.search(rf"({'|'.join(MONTHS)})\D*(20\d{{2}})", filename)
+    if named:
+        return f"{named.group(2)}-{MONTHS.index(named.group(1)) + 1:02d}"
+    return os.path.splitext(filename)[0]
+
+
+def partition_path(nation, month, store_path=STORE_PATH):
+    """
+    Returns the path of the Parquet file holding one nation and month of the store.
+    """
+    return os.path.join(
+        store_path, f"nation={nation}", f"month={month}", "data.parquet"
+    )
+
+
+def ingest_hash(columns, dtypes, read_kwargs):
+    """
+    Identifies the settings a month is converted with: the columns read, their dtypes and the csv read options.
+    """
+    settings = {"columns": columns, "dtypes": dtypes, "read_kwargs": read_kwargs}
+    return hashlib.sha256(
+        json.dumps(settings, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def _partition_hash(partition):
+    """
+    Returns the settings hash recorded in a partition's Parquet metadata, or None if it has none.
+    """
+    metadata = pq.read_schema(partition).metadata or {}
+    hash_value = metadata.get(INGEST_HASH_KEY)
+    return hash_value.decode() if hash_value is not None else None
+
+
+def ingest_month(
+    file_path,
+    nation,
+    columns,
+    dtypes,
+    source=None,
+    chunksize=CHUNKSIZE,
+    store_path=STORE_PATH,
+    **read_kwargs,
+):
+    """
+    Converts one downloaded month of prescribing data into its nation/month partition of the Parquet store.
+    columns maps the nation's column names to the normalised practice, description and items names; dtypes gives their compact dtypes.
+    source overrides where the csv is read from (e.g. a zip member); file_path is still used for the month and to check freshness.
+    Partitions newer than the downloaded file and converted with the same columns, dtypes and read options
+    (recorded in the Parquet metadata) are left as they are, so each month is only converted once.
+    Returns the partition path.
+    """
+    partition = partition_path(nation, month_key(file_path), store_path)
+    settings_hash = ingest_hash(columns, dtypes, read_kwargs)
+    if (
+        os.path.exists(partition)
+        and os.path.getmtime(partition) >= os.path.getmtime(file_path)
+        and _partition_hash(partition) == settings_hash
+    ):
+        return partition
+
+    os.makedirs(os.path.dirname(partition), exist_ok=True)
+    writer = None
+    try:
+        for chunk in read_columns_in_chunks(
+            source or file_path, dtypes, chunksize=chunksize, **read_kwargs
+        ):
+            table = pa.Table.from_pandas(
+                chunk.rename(columns=columns), preserve_index=False
+            )
+            if writer is None:
+                # Store categoricals as plain strings; Parquet dictionary encodes them on write
+                schema = pa.schema(
+                    [
+                        pa.field(field.name, field.type.value_type)
+                        if pa.types.is_dictionary(field.type)
+                        else field
+                        for field in table.schema
+                    ],
+                    metadata={INGEST_HASH_KEY: settings_hash.encode()},
+                )
+                writer = pq.ParquetWriter(
+                    partition + ".tmp", schema, use_dictionary=True
+                )
+            writer.write_table(table.cast(schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(partition + ".tmp", partition)
+    print(f" {os.path.basename(file_path)} converted to {partition}")
+    return partition
+
+
+def read_partition_in_chunks(partition, columns, chunksize=CHUNKSIZE):
+    """
+    Streams a partition of the store, reading only the normalised columns in columns.
+    Chunks are renamed back to the nation's column names and descriptions come back as categoricals from the dictionary pages.
+    Rows with a missing practice are dropped, as a groupby would, and missing items are counted as 0 prescribed,
+    so practice codes and items keep their integer dtypes.
+    chunksize=None reads the whole partition as a single chunk.
+    """
+    parquet_file = pq.ParquetFile(partition, read_dictionary=["description"])
+    batch_size = chunksize or max(parquet_file.metadata.num_rows, 1)
+    for batch in parquet_file.iter_batches(
+        batch_size=batch_size, columns=list(columns.values())
+    ):
+        if "practice" in batch.schema.names and batch["practice"].null_count:
+            batch = batch.filter(pc.is_valid(batch["practice"]))
+        if "items" in batch.schema.names and batch["items"].null_count:
+            items = batch.schema.get_field_index("items")
+            batch = pa.RecordBatch.from_arrays(
+                [
+                    pc.fill_null(column, 0) if position == items else column
+                    for position, column in enumerate(batch.columns)
+                ],
+                schema=batch.schema,
+            )
+        yield batch.to_pandas().rename(
+            columns={normalised: column for column, normalised in columns.items()}
+        )
@@ -0,0 +1,109 @@
+import numpy as np
+import shapely
+import rasterio as rst
+from rasterio import features, windows
+
+# Rows and columns predicted at a time; a 1024 x 1024 tile is about 1M points
+TILE_SIZE = 1024
+
+
+def raster_transform(xmin, ymax, cellsize=250):
+    """
+    Returns the affine transform of a north-up grid whose cell centres are xmin + col * cellsize, ymax - row * cellsize.
+    Half a cell of padding places the raster origin at the top left corner of the first cell, so cells are centred on the grid.
+    """
+    half = cellsize / 2
+    return rst.Affine.from_gdal(xmin - half, cellsize, 0, ymax + half, 0, -cellsize)
+
+
+def predict_raster(
+    model,
+    xmin,
+    ymax,
+    shape,
+    cellsize=250,
+    mask=None,
+    tile_size=TILE_SIZE,
+    path=None,
+    crs=None,
+):
+    """
+    Predicts a fitted model (e.g. IDWInterpolator) at the cell centres of a north-up grid of shape (rows, cols).
+    The grid is walked in tile_size square tiles, so only one tile of coordinates and predictions is held at a time.
+    mask is an optional geo series of land or zone polygons: tiles that miss it are skipped and only cells touching
+    it are predicted, the rest are left NaN. Every cell whose centre lies in a polygon is still predicted.
+    Results go into a preallocated float32 array, or with path, into a float32 GeoTIFF written tile by tile.
+    Returns the array, or the path of the GeoTIFF.
+    """
+    rows, cols = shape
+    transform = raster_transform(xmin, ymax, cellsize)
+    if mask is not None:
+        mask_geometries = np.asarray(getattr(mask, "geometry", mask))
+        tree = shapely.STRtree(mask_geometries)
+
+    if path is None:
+        out = np.full(shape, np.nan, dtype="float32")
+    else:
+        out = rst.open(
+            path,
+            "w",
+            driver="GTiff",
+            height=rows,
+            width=cols,
+            count=1,
+            dtype="float32",
+            crs=crs,
+            transform=transform,
+            nodata=np.nan,
+            tiled=True,
+            compress="deflate",
+        )
+
+    predicted, skipped = 0, 0
+    try:
+        for row in range(0, rows, tile_size):
+            for col in range(0, cols, tile_size):
+                window = windows.Window(
+                    col, row, min(tile_size, cols - col), min(tile_size, rows - row)
+                )
+                tile = np.full((window.height, window.width), np.nan, dtype="float32")
+
+                # Find the cells of the tile to predict, skipping tiles outside the mask
+                if mask is None:
+                    inside = np.ones(tile.shape, dtype=bool)
+                else:
+                    hits = tree.query(shapely.box(*windows.bounds(window, transform)))
+                    if len(hits) == 0:
+                        inside = np.zeros(tile.shape, dtype=bool)
+                    else:
+                        inside = features.geometry_mask(
+                            mask_geometries[hits],
+                            out_shape=tile.shape,
+                            transform=windows.transform(window, transform),
+                            all_touched=True,
+                            invert=True,
+                        )
+
+                if inside.any():
+                    tile_rows, tile_cols = np.nonzero(inside)
+                    xy = np.column_stack(
+                        [
+                            xmin + (col + tile_cols) * cellsize,
+                            ymax - (row + tile_rows) * cellsize,
+                        ]
+                    )
+                    tile[tile_rows, tile_cols] = model.predict(xy)
+                    predicted += len(xy)
+                else:
+                    skipped += 1
+
+                if path is None:
+                    out[row : row + window.height, col : col + window.width] = tile
+                else:
+                    out.write(tile, 1, window=window)
+    finally:
+        if path is not None:
+            out.close()
+
+    print(f" {predicted} of {rows * cols} cells predicted, {skipped} tiles skipped")
+    return out if path is None else path
@@ -0,0 +1,452 @@
+import os
+import numpy as np
+import pandas as pd
+from .nations import gp_scores_file, nation_config, zone_scores_file
+from .paths import extdata_path
+from .plotting import plot, histogram, gp_score_map, decile_map
+
+# Scoring of zones by inverse distance weighting of the GP loneliness scores, shared by scotland, wales and ni
+# Modules that load geopandas, rasterio, scipy, sklearn or pyarrow are imported by the functions that use them
+
+
+def load_gp_scores(nation):
+    """
+    Loads loneliness scores by GP created by build_preproc() in preproc.py.
+    """
+    return pd.read_csv(extdata_path(gp_scores_file(nation)))
+
+
+def create_gp_coordinate_geoframe(nation, gp_postcode=None):
+    """
+    Looks up GP postcodes in the National Statistics Postcode Lookup, via the local postcode table in postcode_lookup.py.
+    Joins to gp_postcode, the output of load_gp_scores() (loaded if not given), to get coordinates per GP surgery.
+    Returns a geoframe gp_geo used in subsequent functions.
+    """
+    import geopandas as gpd
+    from .postcode_lookup import lookup_postcodes, normalise_postcodes
+
+    if gp_postcode is None:
+        gp_postcode = load_gp_scores(nation)
+
+    # Look up GP postcodes in the local NSPL postcode table, extracted from the NSPL download on first use
+    nspl = lookup_postcodes(gp_postcode["postcode"])
+
+    # Join gp_postcode to nspl
+    gp_postcode = gp_postcode.rename(columns={"postcode": "pcds"})
+    gp_postcode["pcds"] = normalise_postcodes(gp_postcode["pcds"])
+    gp_coordinates = gp_postcode.merge(nspl, on="pcds", how="left")
+
+    # Drop GPs whose postcode is not in the NSPL or has no grid reference
+    unmatched = gp_coordinates[["oseast1m", "osnrth1m"]].isna().any(axis=1)
+    if unmatched.any():
+        print(
+            f"{unmatched.sum()} GP postcodes without coordinates dropped:",
+            gp_coordinates.loc[unmatched, "pcds"].tolist(),
+        )
+    gp_coordinates = gp_coordinates[~unmatched]
+
+    # Read df as Geodataframe
+    gp_geo = gpd.GeoDataFrame(
+        data=gp_coordinates,
+        crs="epsg:27700",  # EPSG 27700 == British National Grid coords
+        geometry=gpd.points_from_xy(
+            gp_coordinates["oseast1m"], gp_coordinates["osnrth1m"]
+        ),  # New column, "geometry" is created from the coordinate arrays
+    )
+    print("gp_geo geodataframe created.")
+
+    # Plot loneliness scores - check it is evenly distributed across the nation; note clusters around cities
+    plot(
+        f"{nation}_gp_scores",
+        gp_score_map,
+        gp_geo,
+        title="Loneliness score by GP - evenly distributed; cluster around cities. Dark = high loneliness.",
+    )
+
+    return gp_geo
+
+
+def find_best_params(nation, gp_geo):
+    """
+    Finds best values of k and p for IDW model using a cross validated grid search over the nation's idw_neighbours
+    and idw_powers.
+    Neighbours are queried once per fold, so a fine grid of k and p is cheap to search.
+    Compares the mean squared error of predicted values for best values with default values of k and p.
+    Takes gp_geo created in create_gp_coordinate_geoframe() as input.
+    Returns a dict of best k and best p value.
+    """
+    from sklearn.model_selection import train_test_split, KFold
+    from sklearn.metrics import mean_squared_error
+    from .idw import IDWInterpolator, tune_idw_params
+
+    config = nation_config(nation)
+
+    # Get existing point locations and values to fit the model from gp_geo
+    points = gp_geo[["oseast1m", "osnrth1m"]].values
+    vals = gp_geo["loneliness_zscore"].values
+
+    # Train test split
+    X_train, X_test, y_train, y_test = train_test_split(
+        points, vals, test_size=0.2, random_state=42
+    )
+
+    # Find best params
+    param_grid = {
+        "n_neighbors": list(config["idw_neighbours"]),
+        "p": np.arange(*config["idw_powers"]),
+    }
+    kf = KFold(n_splits=5, shuffle=True, random_state=42)
+    best_k, best_p, _ = tune_idw_params(
+        X_train, y_train, param_grid["n_neighbors"], param_grid["p"], kf
+    )
+    print("Best k:", best_k)
+    print("Best p:", best_p)
+
+    # Compare the MSE of the best params with the default params (k = 5, p = 2)
+    grid = IDWInterpolator(best_k, best_p).fit(X_train, y_train)
+    default = IDWInterpolator(5, 2).fit(X_train, y_train)
+    y_pred_grid = grid.predict(X_test)
+    y_pred_default = default.predict(X_test)
+    print(f" Grid Search MSE: {mean_squared_error(y_test, y_pred_grid)}")
+    print(f" Default params MSE: {mean_squared_error(y_test, y_pred_default)}")
+    best_params = {"best_k": best_k, "best_p": best_p}
+    return best_params
+
+
+def fit_best_model(gp_geo, best_params):
+    """
+    Trains and fits the IDW model with best_params from find_best_params() on the GP scores in gp_geo.
+    """
+    from .idw import IDWInterpolator
+
+    points = gp_geo[["oseast1m", "osnrth1m"]].values
+    vals = gp_geo["loneliness_zscore"].values
+    best_model = IDWInterpolator(best_params["best_k"], best_params["best_p"])
+    return best_model.fit(points, vals)
+
+
+def create_grid(gp_geo, cellsize=250):
+    """
+    Creates an evenly spaced grid of all possible x and y coords within the bounds of the data used for prediction.
+    Ensures even spacing for uniform coverage of the surface for estimation.
+    cellsize is in metres on BNG; 250 = 250m x 250m cells.
+    Takes gp_geo created in create_gp_coordinate_geoframe() as input.
+    Only the origin and shape of the grid are returned; cell coordinates are generated tile by tile in predict_scores().
+    Returns xmin, ymax and the (rows, cols) shape of the grid, used for inputs in subsequent functions.
+    """
+    xmin_coords = gp_geo["oseast1m"].min()
+    xmax_coords = gp_geo["oseast1m"].max()
+    ymin_coords = gp_geo["osnrth1m"].min()
+    ymax_coords = gp_geo["osnrth1m"].max()
+
+    # Adjust x and y ranges to be perfectly divisible by cellsize using floor and ceiling division, ensuring even spacing
+    xmin = (xmin_coords // cellsize) * cellsize
+    xmax = -(-xmax_coords // cellsize) * cellsize
+    ymin = (ymin_coords // cellsize) * cellsize
+    ymax = -(-ymax_coords // cellsize) * cellsize
+
+    # Number of cells spanning the adjusted min/max range with regular spacing determined by cellsize
+    shape = (int((ymax - ymin) / cellsize), int((xmax - xmin) / cellsize))
+
+    return xmin, ymax, shape
+
+
+def predict_scores(
+    gp_geo, xmin, ymax, shape, best_params, cellsize=250, mask=None, path=None
+):
+    """
+    Generate loneliness scores for the cells of the grid from create_grid().
+    Uses the vectorised IDWInterpolator from idw.py with best_params from find_best_params().
+    The grid is predicted tile by tile into a float32 array, so memory stays bounded at finer cellsizes.
+    mask is an optional geo series of boundaries; tiles outside it are skipped and cells outside it are left NaN.
+    path writes the scores to a GeoTIFF instead of holding them in memory.
+    Takes the grid from create_grid() and gp_geo created in create_gp_coordinate_geoframe() as inputs.
+    Returns predictions in a 2D array, or the path of the GeoTIFF.
+    """
+    from .raster_prediction import predict_raster
+
+    best_model = fit_best_model(gp_geo, best_params)
+
+    # Predict loneliness scores for the cells of the grid, north up to align with the raster transform
+    scores_reshaped = predict_raster(
+        best_model, xmin, ymax, shape, cellsize, mask=mask, path=path
+    )
+    print(shape)
+    return scores_reshaped
+
+
+def load_zone_boundaries(nation):
+    """
+    Loads the nation's zone boundaries (dz, LSOA or SDZ) from the boundary store in boundary_store.py,
+    downloading them on first use only.
+    Returns geo df of zone boundaries.
+    """
+    from .boundary_store import load_boundaries
+
+    config = nation_config(nation)
+
+    # Load boundaries from the local boundary store, projected once if the nation has a boundaries_crs, with a simplified copy for plotting
+    zone_coords = load_boundaries(
+        config["boundaries_url"],
+        shapefile=config["boundaries_shapefile"],
+        crs=config["boundaries_crs"],
+        simplify_tolerance=50,
+        verify=config["boundaries_verify"],
+    )
+    if config["expected_zones"] is not None:
+        label = config["zone_label"]
+        print(
+            f"Are there {config['expected_zones']:,} {label}s? {label}s: {zone_coords[config['zone_code_column']].nunique()}"
+        )
+
+    return zone_coords
+
+
+def rank_zone_scores(nation, zone_coords):
+    """
+    Ranks zones and puts into deciles.
+    Generates a map of the nation, by deciles.
+    Takes geo df with a loneliness_zscore col from map_scores_to_zones() or score_zones().
+    Returns geo df with scores, rank and decile by zone.
+    """
+    config = nation_config(nation)
+    label = config["zone_label"]
+
+    # Check histogram is normally distributed
+    plot(
+        f"{nation}_{config['zone']}_scores_histogram",
+        histogram,
+        zone_coords["loneliness_zscore"],
+        title=f"Histogram of Loneliness Z Score, averaged per {label}",
+    )
+
+    # Create rank and decile columns
+    zone_coords["rank"] = zone_coords["loneliness_zscore"].rank()
+    zone_coords["deciles"] = pd.qcut(
+        zone_coords["loneliness_zscore"], q=10, labels=[1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+    )
+
+    # Generate map of the nation with decile colours to check
+    # Plot the simplified boundaries kept in the boundary store
+    missing = zone_coords["loneliness_zscore"].isna().sum()
+    title = f"Loneliness Decile by {label}"
+    if missing:
+        title += f" - {missing} values missing"
+    plot(
+        f"{nation}_{config['zone']}_deciles",
+        decile_map,
+        zone_coords.set_geometry("simplified")[["deciles", "simplified"]],
+        title=title,
+        reverse=config["reverse_deciles"],
+    )
+
+    return zone_coords
+
+
+def map_scores_to_zones(
+    nation, xmin, ymax, scores_reshaped, cellsize=250, zone_coords=None
+):
+    """
+    Maps loneliness scores to zones, averaging the grid cells in each zone.
+    Takes coordinates from create_grid() and scores_reshaped from predict_scores(), an array or GeoTIFF path.
+    Loads the nation's zone boundaries unless zone_coords is given.
+    Returns geo df with scores, rank and decile by zone.
+    """
+    from .raster_prediction import raster_transform
+    from .zonal import zonal_statistics
+
+    config = nation_config(nation)
+    if zone_coords is None:
+        zone_coords = load_zone_boundaries(nation)
+
+    # Define transformation to project row and columns from IDW model estimates to BNG coordinates
+    trans = raster_transform(xmin, ymax, cellsize)
+
+    # Get the mean predicted score of the cells in each polygon, from a label raster of the boundaries cached across runs
+    zone_score = zonal_statistics(
+        zone_coords["geometry"],
+        scores_reshaped,
+        trans,
+        source=config["boundaries_url"],
+    )
+
+    # Add mean score as col in geodf
+    zone_coords["loneliness_zscore"] = zone_score["mean"]
+    missing = zone_coords["loneliness_zscore"].isna().sum()
+    if missing:
+        print(
+            f"{missing} {config['zone_label']}s without score do not have GP postcodes within their boundary."
+        )
+
+    return rank_zone_scores(nation, zone_coords)
+
+
+def score_zones(nation, gp_geo, best_params, cellsize=250):
+    """
+    Generates loneliness scores directly for zones, skipping the grid over the bounding box of all GPs.
+    Points are sampled every cellsize metres inside the zone boundaries only, predicted and averaged per zone,
+    so prediction work scales with the area of the zones rather than their bounding box.
+    Zones too small to hold a sample point are predicted at a single point inside them.
+    Alternative to create_grid(), predict_scores() and map_scores_to_zones(); uses best_params from find_best_params().
+    Returns geo df with scores, rank and decile by zone.
+    """
+    from .zone_sampling import predict_zone_scores
+
+    zone_coords = load_zone_boundaries(nation)
+    best_model = fit_best_model(gp_geo, best_params)
+
+    # Predict at points sampled inside each zone and average per zone
+    zone_coords["loneliness_zscore"] = predict_zone_scores(
+        best_model, zone_coords["geometry"], cellsize
+    )
+
+    return rank_zone_scores(nation, zone_coords)
+
+
+def save_geodataframe(nation, zone_coords):
+    """
+    Save geodf as csv in inst/extdata/.
+    """
+    config = nation_config(nation)
+
+    # Tidy geodf for csv
+    zone_csv = zone_coords[
+        [config["zone_code_column"], "loneliness_zscore", "rank", "deciles"]
+    ].rename(columns={config["zone_code_column"]: config["zone_code_name"]})
+    zone_csv.to_csv(extdata_path(zone_scores_file(nation)), index=False)
+    print("CSV saved in inst/extdata.")
+
+
+def predict_grid(gp_geo, grid, best_params, zone_coords, cellsize=250):
+    """
+    Runs predict_scores() over the grid from create_grid(), masked to the zone boundaries in zone_coords.
+    Stage of build_idw(); returns the 2D array of predictions.
+    """
+    xmin, ymax, shape = grid
+    return predict_scores(
+        gp_geo,
+        xmin,
+        ymax,
+        shape,
+        best_params,
+        cellsize,
+        mask=zone_coords["geometry"],
+    )
+
+
+def map_grid_to_zones(nation, grid, scores_reshaped, zone_coords, cellsize=250):
+    """
+    Runs map_scores_to_zones() on the predictions of predict_grid() over the grid from create_grid().
+    Stage of build_idw(); returns geo df with scores, rank and decile by zone.
+    """
+    xmin, ymax, _ = grid
+    return map_scores_to_zones(
+        nation, xmin, ymax, scores_reshaped, cellsize, zone_coords=zone_coords
+    )
+
+
+def add_idw_stages(runner, nation, direct=False, cellsize=250):
+    """
+    Adds the stages of build_idw() for a nation to a StageRunner from stages.py and returns the name of the last.
+    The first stage depends on the content of <nation>_gp_2022.csv, so an unchanged csv leaves every stage cached,
+    and changing the IDW settings reruns the tuning and prediction stages only.
+    Zone boundaries and the grid are not cached as stages; they come from the boundary store and are cheap to rebuild.
+    """
+    from .postcode_lookup import POSTCODE_TABLE_PATH
+    from .stages import file_hash
+
+    config = nation_config(nation)
+    boundary_settings = {
+        key: config[key]
+        for key in [
+            "boundaries_url",
+            "boundaries_shapefile",
+            "boundaries_crs",
+            "zone_code_column",
+        ]
+    }
+    ranking_settings = {
+        key: config[key] for key in ["zone", "zone_label", "reverse_deciles"]
+    }
+
+    gp_geo = runner.add(
+        f"{nation}/create_gp_coordinate_geoframe",
+        create_gp_coordinate_geoframe,
+        params={"nation": nation},
+        depends={
+            "gp_scores": file_hash(extdata_path(gp_scores_file(nation))),
+            "postcode_table": os.path.basename(POSTCODE_TABLE_PATH),
+        },
+    )
+    best_params = runner.add(
+        f"{nation}/find_best_params",
+        find_best_params,
+        inputs={"gp_geo": gp_geo},
+        params={"nation": nation},
+        depends={key: config[key] for key in ["idw_neighbours", "idw_powers"]},
+    )
+    if direct:
+        # Skip the grid and predict only inside the zone boundaries
+        return runner.add(
+            f"{nation}/score_zones",
+            score_zones,
+            inputs={"gp_geo": gp_geo, "best_params": best_params},
+            params={"nation": nation, "cellsize": cellsize},
+            depends={**boundary_settings, **ranking_settings},
+        )
+
+    # Only predict grid cells within the zone boundaries
+    zone_coords = runner.add(
+        f"{nation}/load_zone_boundaries",
+        load_zone_boundaries,
+        params={"nation": nation},
+        depends=boundary_settings,
+        cache=False,
+    )
+    grid = runner.add(
+        f"{nation}/create_grid",
+        create_grid,
+        inputs={"gp_geo": gp_geo},
+        params={"cellsize": cellsize},
+        cache=False,
+    )
+    scores_reshaped = runner.add(
+        f"{nation}/predict_grid",
+        predict_grid,
+        inputs={
+            "gp_geo": gp_geo,
+            "grid": grid,
+            "best_params": best_params,
+            "zone_coords": zone_coords,
+        },
+        params={"cellsize": cellsize},
+    )
+    return runner.add(
+        f"{nation}/map_grid_to_zones",
+        map_grid_to_zones,
+        inputs={
+            "grid": grid,
+            "scores_reshaped": scores_reshaped,
+            "zone_coords": zone_coords,
+        },
+        params={"nation": nation, "cellsize": cellsize},
+        depends=ranking_settings,
+    )
+
+
+def build_idw(nation, direct=False, cellsize=250, runner=None):
+    """
+    Runs all functions required to score, rank and decile the nation's zones from <nation>_gp_2022.csv,
+    saving <nation>_clinical_loneliness_<zone>.csv in inst/extdata/.
+    direct=True skips the grid and predicts only inside the zone boundaries with score_zones().
+    The functions run as stages of runner (a new StageRunner if not given), skipping those whose inputs are unchanged.
+    """
+    from .stages import StageRunner
+
+    if runner is None:
+        runner = StageRunner()
+    zone_coords = runner.get(
+        add_idw_stages(runner, nation, direct=direct, cellsize=cellsize)
+    )
+    save_geodataframe(nation, zone_coords)
+    return zone_coords
@@ -0,0 +1,310 @@
+import os
+import sys
+import json
+import inspect
+import hashlib
+import numpy as np
+import pandas as pd
+from .instrumentation import StageMetrics, count_rows
+from .paths import extdata_path
+
+# Outputs of pipeline stages, one folder per stage holding <fingerprint>.<format> files and their .meta.json records
+STAGE_CACHE_PATH = extdata_path("stage_cache")
+
+# Part of every fingerprint; bump it when the way outputs are stored changes to invalidate every cached stage
+CACHE_VERSION = 1
+
+
+def file_hash(path):
+    """
+    Returns the sha256 of a file's contents, e.g. to make a stage depend on drug_list.csv.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def code_hash(function):
+    """
+    Identifies the code of a stage by the source of its function, so editing the function reruns the stage.
+    Changes to the helpers it calls are not seen; run with refresh to rebuild after editing those.
+    """
+    return hashlib.sha256(inspect.getsource(function).encode()).hexdigest()
+
+
+def _json_default(value):
+    """
+    Converts numpy scalars, ranges and other values that json cannot write.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, range):
+        return [value.start, value.stop, value.step]
+    return str(value)
+
+
+class StageRunner:
+    """
+    Runs pipeline stages as a DAG, caching the output of each stage under a fingerprint of everything it depends on:
+    the content hash of each upstream output, the stage's code, its parameters and any other settings it reads.
+    A stage whose fingerprint is unchanged is loaded from the cache instead of being run, and stages upstream of it
+    are not run or loaded at all, so e.g. changing the IDW grid reruns the IDW stages only.
+    Because upstream outputs are identified by content, a rerun stage that produces the same output leaves
+    the stages downstream of it cached.
+    Outputs are stored by type: data frames (and geo data frames) as Parquet, arrays as npy read back memory
+    mapped, practice x drug matrices as npz, and anything else as json.
+    refresh=True reruns every stage, or a collection of stage names (e.g. {"count_drugs"}) reruns those stages;
+    use it when data a stage reads has changed in a way its fingerprint cannot see.
+    When a stage is rewritten under a new fingerprint, the files of its earlier fingerprints are removed.
+    Each stage that runs or is loaded from the cache is measured by metrics, a StageMetrics from instrumentation.py.
+    """
+
+    def __init__(self, cache_path=STAGE_CACHE_PATH, refresh=False, metrics=None):
+        self.cache_path = cache_path
+        self.refresh = refresh
+        self.metrics = metrics if metrics is not None else StageMetrics()
+        self._stages = {}
+        self._fingerprints = {}
+        self._hashes = {}
+        self._outputs = {}
+
+    def add(
+        self,
+        name,
+        function,
+        inputs=None,
+        params=None,
+        options=None,
+        depends=None,
+        cache=True,
+        always_run=False,
+    ):
+        """
+        Adds a stage computing function(**params, **options, **upstream outputs) and returns its name.
+        name is unique across the runner, e.g. "scotland/count_condition".
+        inputs maps arguments of function to the names of the stages whose outputs they take.
+        params are fingerprinted arguments; options are arguments that do not change the output (e.g. workers).
+        depends holds fingerprinted values the function reads itself, such as settings or file hashes.
+        cache=False runs the stage whenever its output is needed, for cheap stages or data cached elsewhere;
+        its fingerprint then stands in for the content of its output.
+        always_run=True runs the stage every time but still caches its output by content, so the stages downstream only
+        rerun when its output changes; for cheap checks of data that can change at the source, such as downloads.
+        """
+        self._stages[name] = {
+            "function": function,
+            "inputs": inputs or {},
+            "params": params or {},
+            "options": options or {},
+            "depends": depends or {},
+            "cache": cache,
+            "always_run": always_run,
+        }
+        return name
+
+    def _refreshing(self, name):
+        """
+        Whether a stage is rerun regardless of its cached output.
+        """
+        if self._stages[name]["always_run"]:
+            return True
+        if isinstance(self.refresh, bool):
+            return self.refresh
+        return name in self.refresh or name.split("/")[-1] in self.refresh
+
+    def fingerprint(self, name):
+        """
+        Returns the fingerprint of a stage, resolving the content hashes of its upstream outputs.
+        Upstream stages are only run if their own outputs are not cached.
+        """
+        if name not in self._fingerprints:
+            stage = self._stages[name]
+            key = {
+                "version": CACHE_VERSION,
+                "stage": name,
+                "code": code_hash(stage["function"]),
+                "params": stage["params"],
+                "depends": stage["depends"],
+                "inputs": {
+                    argument: self.output_hash(upstream)
+                    for argument, upstream in stage["inputs"].items()
+                },
+            }
+            self._fingerprints[name] = hashlib.sha256(
+                json.dumps(key, sort_keys=True, default=_json_default).encode()
+            ).hexdigest()
+        return self._fingerprints[name]
+
+    def _path(self, name, extension):
+        """
+        Returns the path of a file of a stage's current fingerprint in the cache.
+        """
+        return os.path.join(
+            self.cache_path,
+            *name.split("/"),
+            f"{self.fingerprint(name)[:16]}.{extension}",
+        )
+
+    def _cached(self, name):
+        """
+        Returns the record of a stage's cached output, or None if it must be run.
+        """
+        if not self._stages[name]["cache"] or self._refreshing(name):
+            return None
+        meta_path = self._path(name, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as meta_file:
+            return json.load(meta_file)
+
+    def output_hash(self, name):
+        """
+        Returns the content hash of a stage's output, from its cache record if it has one, otherwise by running it.
+        """
+        if name not in self._hashes:
+            meta = self._cached(name)
+            if not self._stages[name]["cache"]:
+                self._hashes[name] = self.fingerprint(name)
+            elif meta is not None:
+                self._hashes[name] = meta["hash"]
+            else:
+                self.get(name)
+        return self._hashes[name]
+
+    def get(self, name):
+        """
+        Returns the output of a stage: from memory if it has been used in this run, from the cache if its fingerprint
+        is unchanged, otherwise by running it on the outputs of its upstream stages and caching the result.
+        """
+        if name in self._outputs:
+            return self._outputs[name]
+        stage = self._stages[name]
+
+        meta = self._cached(name)
+        if meta is not None:
+            with self.metrics.measure(name, "cached") as record:
+                output = self._load(name, meta["format"])
+                record["rows_out"] = count_rows(output)
+            print(f" {name} loaded from cache")
+        else:
+            # Upstream data frames are copied, as some stages add columns to their inputs
+            upstream = {
+                argument: _copy(self.get(upstream))
+                for argument, upstream in stage["inputs"].items()
+            }
+            print(f" Running {name}")
+            with self.metrics.measure(
+                name,
+                "run",
+                rows_in={
+                    argument: count_rows(value) for argument, value in upstream.items()
+                },
+            ) as record:
+                output = stage["function"](
+                    **stage["params"], **stage["options"], **upstream
+                )
+                record["rows_out"] = count_rows(output)
+            if stage["cache"]:
+                meta = self._save(name, output)
+        if meta is not None:
+            self._hashes[name] = meta["hash"]
+        self._outputs[name] = output
+        return output
+
+    def _save(self, name, output):
+        """
+        Writes a stage's output to the cache, then its record with the format and content hash of the output.
+        Returns the record.
+        """
+        if isinstance(output, pd.DataFrame):
+            # Geo data frames are written as GeoParquet and keep their geometry columns and crs
+            # Only checked if geopandas is loaded, as no output can be a GeoDataFrame otherwise
+            geopandas = sys.modules.get("geopandas")
+            if geopandas is not None and isinstance(output, geopandas.GeoDataFrame):
+                output_format = "geoparquet"
+            else:
+                output_format = "parquet"
+            extension = "parquet"
+        elif isinstance(output, np.ndarray):
+            output_format, extension = "npy", "npy"
+        elif _is_drug_matrix(output):
+            output_format, extension = "npz", "npz"
+        else:
+            output_format, extension = "json", "json"
+
+        path = self._path(name, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as output_file:
+            if extension == "parquet":
+                output.to_parquet(output_file)
+            elif extension == "npy":
+                np.save(output_file, output)
+            elif extension == "npz":
+                output.save(output_file)
+            else:
+                output_file.write(json.dumps(output, default=_json_default).encode())
+        os.replace(path + ".tmp", path)
+
+        meta = {
+            "stage": name,
+            "fingerprint": self.fingerprint(name),
+            "format": output_format,
+            "hash": file_hash(path),
+        }
+        meta_path = self._path(name, "meta.json")
+        with open(meta_path + ".tmp", "w") as meta_file:
+            json.dump(meta, meta_file, indent=2)
+        os.replace(meta_path + ".tmp", meta_path)
+        self._prune(name)
+        return meta
+
+    def _prune(self, name):
+        """
+        Removes the files of a stage's earlier fingerprints from the cache, as no run reads them once it is rewritten.
+        """
+        folder = os.path.join(self.cache_path, *name.split("/"))
+        current = self.fingerprint(name)[:16] + "."
+        for filename in os.listdir(folder):
+            path = os.path.join(folder, filename)
+            # Other stages' folders and files still being written are left alone
+            if (
+                os.path.isfile(path)
+                and not filename.startswith(current)
+                and not filename.endswith(".tmp")
+            ):
+                os.remove(path)
+
+    def _load(self, name, output_format):
+        """
+        Reads a stage's cached output in the format it was written in.
+        """
+        if output_format == "geoparquet":
+            import geopandas as gpd
+
+            return gpd.read_parquet(self._path(name, "parquet"))
+        if output_format == "parquet":
+            return pd.read_parquet(self._path(name, "parquet"))
+        if output_format == "npy":
+            return np.load(self._path(name, "npy"), mmap_mode="r")
+        if output_format == "npz":
+            from .drug_matrix import PracticeDrugMatrix
+
+            return PracticeDrugMatrix.load(self._path(name, "npz"))
+        with open(self._path(name, "json")) as output_file:
+            return json.load(output_file)
+
+
+def _is_drug_matrix(value):
+    """
+    Whether an output is a PracticeDrugMatrix; only checked if drug_matrix.py is loaded, as none can exist otherwise.
+    """
+    drug_matrix = sys.modules.get(f"{__package__}.drug_matrix")
+    return drug_matrix is not None and isinstance(value, drug_matrix.PracticeDrugMatrix)
+
+
+def _copy(value):
+    """
+    Copies data frames handed to a stage, leaving arrays and other outputs as they are.
+    """
+    return value.copy() if isinstance(value, pd.DataFrame) else value
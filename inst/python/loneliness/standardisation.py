@@ -0,0 +1,42 @@
+import numpy as np
+
+# Z-scores of prescribing rates and the composite loneliness score, over a matrix of places x illnesses at once
+# Used by standardise() in preproc.py; numpy only, so any number of illnesses or drug classes costs one pass
+
+# Scales the median absolute deviation to the standard deviation of normally distributed values
+MAD_SCALE = 1.4826
+
+# Scales the mean absolute deviation to the standard deviation, used where over half the values equal the median
+MEANAD_SCALE = 1.2533
+
+
+def zscores(values, robust=False):
+    """
+    Standardises each column of a 2D array of rates (rows are places, e.g. GP postcodes; columns are illnesses).
+    By default the mean and population standard deviation are used, as scipy.stats.zscore does.
+    robust=True uses the median and the median absolute deviation instead, so a few extreme practices do not set the
+    scale; where the MAD is zero the mean absolute deviation from the median is used.
+    A column holding a missing value or no spread gives NaN z-scores, as with scipy.stats.zscore.
+    Returns a float64 array of the same shape.
+    """
+    values = np.asarray(values, dtype="float64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if not robust:
+            return (values - values.mean(axis=0)) / values.std(axis=0)
+
+        centre = np.median(values, axis=0)
+        deviations = np.abs(values - centre)
+        scale = np.median(deviations, axis=0) * MAD_SCALE
+        scale = np.where(scale == 0, deviations.mean(axis=0) * MEANAD_SCALE, scale)
+        return (values - centre) / scale
+
+
+def composite_scores(values, weights=None, robust=False):
+    """
+    Returns the loneliness score of each row of a 2D array of rates: the sum of its z-scores from zscores(),
+    multiplied by weights, one per column (equal weights if None). Missing z-scores are skipped in the sum.
+    """
+    scores = zscores(values, robust=robust)
+    if weights is not None:
+        scores = scores * np.asarray(weights, dtype="float64")
+    return np.nansum(scores, axis=1)
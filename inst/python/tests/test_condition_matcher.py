@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from loneliness.condition_matcher import ConditionMatcher
+from loneliness.paths import REPO_PATH
+
+# Tests condition_matcher.py against the per-illness str.contains loop it replaced
+# Run from inst/python/ with python -m unittest discover tests
+
+DRUG_LIST_PATH = os.path.join(REPO_PATH, "inst", "extdata", "drug_list.csv")
+
+
+def regex_loop_flags(drug_list, descriptions):
+    """
+    The original code_condition(): one case-insensitive str.contains per illness over every description.
+    """
+    out = {}
+    for illness in drug_list["illness"].unique():
+        out[illness] = (
+            descriptions.str.contains(
+                "|".join(drug_list[drug_list["illness"] == illness]["medication"]),
+                case=False,
+                regex=True,
+            )
+            .fillna(False)
+            .astype("int16")
+        )
+    return pd.DataFrame(out)
+
+
+def prescription_descriptions(drug_list):
+    """
+    Descriptions written the ways the prescribing files write them: each medication in upper, lower and mixed case,
+    with doses and forms around it, two medications in one description, and descriptions matching nothing.
+    """
+    descriptions = []
+    for medication in drug_list["medication"]:
+        descriptions += [
+            f"{medication.upper()} 10MG TABLETS",
+            f"{medication.lower()} 5mg/5ml oral solution",
+            f"Generic {medication.title()}_Tab 20mg",
+            f"{medication.upper()}{medication.upper()} 1MG",
+        ]
+    medications = list(drug_list["medication"])
+    descriptions += [
+        f"{first.upper()} AND {second.upper()} CAPS"
+        for first, second in zip(medications, medications[7:] + medications[:7])
+    ]
+    descriptions += [
+        "PARACETAMOL 500MG TABLETS",
+        "Ibuprofen 200mg",
+        "",
+        "Vitamin D3 1000unit capsules",
+    ]
+    return pd.Series(descriptions)
+
+
+class ConditionMatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.drug_list = pd.read_csv(DRUG_LIST_PATH)
+
+    def assert_same_as_regex_loop(self, drug_list, descriptions):
+        expected = regex_loop_flags(drug_list, descriptions)
+        flags = ConditionMatcher(drug_list).flags(descriptions)
+        pd.testing.assert_frame_equal(flags, expected)
+
+    def test_matches_regex_loop_on_drug_list(self):
+        self.assert_same_as_regex_loop(
+            self.drug_list, prescription_descriptions(self.drug_list)
+        )
+
+    def test_matches_regex_loop_on_categorical_with_missing(self):
+        descriptions = prescription_descriptions(self.drug_list)
+        descriptions[::5] = np.nan
+        expected = regex_loop_flags(self.drug_list, descriptions)
+        flags = ConditionMatcher(self.drug_list).flags(descriptions.astype("category"))
+        pd.testing.assert_frame_equal(flags, expected)
+
+    def test_contained_medications_flag_every_illness(self):
+        drug_list = pd.DataFrame(
+            {
+                "illness": ["depression", "anxiety", "insomnia", "insomnia"],
+                "medication": ["citalopram", "escitalopram", "zopiclone", "pram"],
+            }
+        )
+        descriptions = pd.Series(
+            [
+                "ESCITALOPRAM 10MG",
+                "Citalopram 20mg",
+                "zopiclone",
+                "Escitalopram/Zopiclone",
+                "PRAMIPEXOLE",
+                "none",
+            ]
+        )
+        self.assert_same_as_regex_loop(drug_list, descriptions)
+        flags = ConditionMatcher(drug_list).flags(descriptions)
+        self.assertEqual(flags.iloc[0].tolist(), [1, 1, 1])
+
+    def test_descriptions_differing_by_case_share_a_classification(self):
+        matcher = ConditionMatcher(self.drug_list)
+        flags = matcher.flags(
+            pd.Series(["SERTRALINE 50MG", "sertraline 50mg", "Sertraline 50Mg"])
+        )
+        self.assertEqual(flags.drop_duplicates().shape[0], 1)
+        self.assertEqual(list(matcher._cache), ["sertraline 50mg"])
+
+
+class ConditionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.drug_list = pd.read_csv(DRUG_LIST_PATH)
+        self.cache_path = os.path.join(tempfile.mkdtemp(), "condition_cache.sqlite")
+        self.descriptions = prescription_descriptions(self.drug_list)
+
+    def stored_rows(self, drug_list_hash):
+        with sqlite3.connect(self.cache_path) as connection:
+            rows = connection.execute(
+                "SELECT COUNT(*) FROM classifications WHERE drug_list_hash = ?",
+                (drug_list_hash,),
+            ).fetchone()[0]
+        connection.close()
+        return rows
+
+    def test_classifications_are_stored_under_drug_list_hash(self):
+        matcher = ConditionMatcher(self.drug_list, cache_path=self.cache_path)
+        matcher.flags(self.descriptions)
+        self.assertEqual(
+            self.stored_rows(matcher.drug_list_hash),
+            self.descriptions.str.lower().nunique(),
+        )
+
+    def test_cache_hit_classifies_nothing_again(self):
+        expected = ConditionMatcher(self.drug_list, cache_path=self.cache_path).flags(
+            self.descriptions
+        )
+        matcher = ConditionMatcher(self.drug_list, cache_path=self.cache_path)
+        self.assertEqual(len(matcher._cache), self.descriptions.str.lower().nunique())
+
+        def fail(description):
+            raise AssertionError(f"{description!r} classified again")
+
+        matcher.match = fail
+        pd.testing.assert_frame_equal(matcher.flags(self.descriptions), expected)
+
+    def test_edited_drug_list_misses_the_cache(self):
+        first = ConditionMatcher(self.drug_list, cache_path=self.cache_path)
+        first.flags(self.descriptions)
+
+        # Moving sertraline to another illness changes the hash, so nothing stored for the old list is used
+        edited = self.drug_list.copy()
+        edited.loc[edited["medication"] == "sertraline", "illness"] = "anxiety"
+        matcher = ConditionMatcher(edited, cache_path=self.cache_path)
+        self.assertNotEqual(matcher.drug_list_hash, first.drug_list_hash)
+        self.assertEqual(matcher._cache, {})
+        pd.testing.assert_frame_equal(
+            matcher.flags(self.descriptions),
+            regex_loop_flags(edited, self.descriptions),
+        )
+        self.assertEqual(self.stored_rows(first.drug_list_hash), len(first._cache))
+
+
+if __name__ == "__main__":
+    unittest.main()
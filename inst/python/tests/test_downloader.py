@@ -0,0 +1,190 @@
+import os
+import json
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from loneliness.downloader import MANIFEST_NAME, VALIDATOR_SUFFIX, download_file
+
+# Tests downloader.py against a local HTTP server standing in for the data portals
+# Run from inst/python/ with python -m unittest discover tests
+
+CONTENT = bytes(range(256)) * 40
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Serves server.files, {path: content}, with the behaviour set on the server: an ETag or none, and whether
+    Range requests are honoured. Every request is logged to server.requests as (method, path, headers).
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, body):
+        server = self.server
+        server.requests.append((self.command, self.path, dict(self.headers)))
+        content = server.files.get(self.path)
+        if content is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = server.etag
+        status, start = 200, 0
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if server.ranges and range_header and (if_range is None or if_range == etag):
+            start = int(range_header.split("=")[1].rstrip("-"))
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(content)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+        self.send_response(status)
+        if etag is not None:
+            self.send_header("ETag", etag)
+        if status == 206:
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}"
+            )
+        self.send_header("Content-Length", str(len(content) - start))
+        self.end_headers()
+        if body:
+            self.wfile.write(content[start:])
+
+    def do_HEAD(self):
+        self._respond(body=False)
+
+    def do_GET(self):
+        self._respond(body=True)
+
+
+class DownloadFileTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        self.server.files = {"/data.csv": CONTENT}
+        self.server.etag = '"v1"'
+        self.server.ranges = True
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.folder = tempfile.mkdtemp()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/data.csv"
+        self.file_path = os.path.join(self.folder, "data.csv")
+        self.part_path = self.file_path + ".part"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def gets(self):
+        return [
+            headers for method, _, headers in self.server.requests if method == "GET"
+        ]
+
+    def write_part(self, content, validator=None):
+        with open(self.part_path, "wb") as part_file:
+            part_file.write(content)
+        if validator is not None:
+            with open(self.part_path + VALIDATOR_SUFFIX, "w") as validator_file:
+                validator_file.write(validator)
+
+    def read_file(self):
+        with open(self.file_path, "rb") as file:
+            return file.read()
+
+    def test_downloads_file_and_records_etag(self):
+        self.assertEqual(download_file(self.url, self.folder), self.file_path)
+        self.assertEqual(self.read_file(), CONTENT)
+        self.assertFalse(os.path.exists(self.part_path))
+        self.assertTrue(os.path.exists(os.path.join(self.folder, MANIFEST_NAME)))
+
+    def test_skips_file_with_unchanged_etag(self):
+        download_file(self.url, self.folder)
+        download_file(self.url, self.folder)
+        self.assertEqual(len(self.gets()), 1)
+
+    def test_downloads_file_with_changed_etag(self):
+        download_file(self.url, self.folder)
+        self.server.files["/data.csv"] = CONTENT[::-1]
+        self.server.etag = '"v2"'
+        download_file(self.url, self.folder)
+        self.assertEqual(len(self.gets()), 2)
+        self.assertEqual(self.read_file(), CONTENT[::-1])
+
+    def test_resumes_partial_file_with_range(self):
+        self.write_part(CONTENT[:1000], '"v1"')
+        download_file(self.url, self.folder)
+        headers = self.gets()[0]
+        self.assertEqual(headers["Range"], "bytes=1000-")
+        self.assertEqual(headers["If-Range"], '"v1"')
+        self.assertEqual(self.read_file(), CONTENT)
+
+    def test_restarts_when_server_ignores_range(self):
+        self.server.ranges = False
+        self.write_part(b"x" * 1000, '"v1"')
+        download_file(self.url, self.folder)
+        self.assertEqual(self.read_file(), CONTENT)
+
+    def test_restarts_when_file_changed_since_partial_download(self):
+        self.write_part(b"x" * 1000, '"v1"')
+        self.server.etag = '"v2"'
+        download_file(self.url, self.folder)
+        self.assertEqual(self.gets()[0]["If-Range"], '"v1"')
+        self.assertEqual(self.read_file(), CONTENT)
+
+    def test_does_not_resume_without_validator(self):
+        self.server.etag = None
+        self.write_part(b"x" * 1000, "")
+        download_file(self.url, self.folder)
+        self.assertNotIn("Range", self.gets()[0])
+        self.assertEqual(self.read_file(), CONTENT)
+
+    def test_accepts_complete_partial_file_on_416(self):
+        self.write_part(CONTENT, '"v1"')
+        download_file(self.url, self.folder)
+        self.assertEqual(len(self.gets()), 1)
+        self.assertEqual(self.read_file(), CONTENT)
+
+    def test_restarts_when_partial_file_is_too_long_on_416(self):
+        self.write_part(CONTENT + b"stale", '"v1"')
+        download_file(self.url, self.folder)
+        self.assertEqual(len(self.gets()), 2)
+        self.assertNotIn("Range", self.gets()[1])
+        self.assertEqual(self.read_file(), CONTENT)
+
+    def test_does_not_resume_partial_file_without_recorded_validator(self):
+        self.write_part(b"x" * 1000)
+        download_file(self.url, self.folder)
+        self.assertNotIn("Range", self.gets()[0])
+        self.assertEqual(self.read_file(), CONTENT)
+
+    def test_ignores_corrupt_manifest(self):
+        download_file(self.url, self.folder)
+        with open(os.path.join(self.folder, MANIFEST_NAME), "w") as manifest_file:
+            manifest_file.write('{"data.csv": {"etag"')
+        self.assertEqual(download_file(self.url, self.folder), self.file_path)
+        # Checked by size instead, then the manifest is rewritten by the next download
+        self.assertEqual(len(self.gets()), 1)
+        self.server.files["/data.csv"] = CONTENT * 2
+        self.server.etag = '"v2"'
+        download_file(self.url, self.folder)
+        with open(os.path.join(self.folder, MANIFEST_NAME)) as manifest_file:
+            self.assertEqual(json.load(manifest_file)["data.csv"]["etag"], '"v2"')
+
+    def test_missing_file_returns_none(self):
+        url = self.url.replace("data.csv", "missing.csv")
+        self.assertIsNone(download_file(url, self.folder))
+        self.assertEqual(os.listdir(self.folder), [])
+
+    def test_missing_file_falls_back_to_existing_copy(self):
+        download_file(self.url, self.folder)
+        self.server.files = {}
+        self.assertEqual(download_file(self.url, self.folder), self.file_path)
+        self.assertEqual(self.read_file(), CONTENT)
+
+
+if __name__ == "__main__":
+    unittest.main()
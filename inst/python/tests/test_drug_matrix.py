@@ -0,0 +1,97 @@
+import io
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from loneliness.drug_matrix import (
+    MISSING_DRUG,
+    PracticeDrugMatrix,
+    combine_matrices,
+    count_matrix,
+)
+
+# Tests the practice x drug matrices of drug_matrix.py and their npz files
+# Run from inst/python/ with python -m unittest discover tests
+
+
+def month_matrix(postcodes=None):
+    """
+    A small month of prescriptions, one with a missing description, with postcodes for its practices if given.
+    """
+    matrix = count_matrix(
+        pd.Series(["P2", "P1", "P1", "P3", "P2"]),
+        pd.Series(["SERTRALINE", "ZOPICLONE", "SERTRALINE", None, "SERTRALINE"]),
+        pd.Series([1, 2, 3, 4, 5]),
+    )
+    if postcodes is None:
+        return matrix
+    return matrix.select(np.ones(len(matrix.practices), dtype=bool), postcodes)
+
+
+class PracticeDrugMatrixTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "2022-01.npz")
+
+    def round_trip(self, matrix):
+        matrix.save(self.path)
+        return PracticeDrugMatrix.load(self.path)
+
+    def test_count_matrix_sums_items_by_practice_and_drug(self):
+        matrix = month_matrix()
+        self.assertEqual(matrix.practices.tolist(), ["P1", "P2", "P3"])
+        self.assertEqual(
+            matrix.drugs.tolist(), ["SERTRALINE", "ZOPICLONE", MISSING_DRUG]
+        )
+        np.testing.assert_array_equal(
+            matrix.counts.toarray(), [[3, 2, 0], [6, 0, 0], [0, 0, 4]]
+        )
+
+    def test_save_and_load_round_trip(self):
+        matrix = month_matrix(["AB1 2CD", "EF3 4GH", "IJ5 6KL"])
+        loaded = self.round_trip(matrix)
+        np.testing.assert_array_equal(loaded.counts.toarray(), matrix.counts.toarray())
+        self.assertEqual(loaded.practices.tolist(), matrix.practices.tolist())
+        self.assertEqual(loaded.drugs.tolist(), matrix.drugs.tolist())
+        self.assertEqual(loaded.postcodes.tolist(), matrix.postcodes.tolist())
+
+    def test_missing_postcodes_are_read_back_as_missing(self):
+        loaded = self.round_trip(month_matrix(["AB1 2CD", np.nan, None]))
+        self.assertEqual(loaded.postcodes[0], "AB1 2CD")
+        self.assertTrue(pd.isna(loaded.postcodes[1:]).all())
+        self.assertNotIn("nan", loaded.postcodes.tolist())
+        self.assertNotIn("None", loaded.postcodes.tolist())
+
+    def test_matrix_without_postcodes_loads_without_postcodes(self):
+        self.assertIsNone(self.round_trip(month_matrix()).postcodes)
+
+    def test_same_matrix_saves_the_same_bytes(self):
+        first, second = io.BytesIO(), io.BytesIO()
+        month_matrix(["AB1 2CD", np.nan, "IJ5 6KL"]).save(first)
+        month_matrix(["AB1 2CD", np.nan, "IJ5 6KL"]).save(second)
+        self.assertEqual(first.getvalue(), second.getvalue())
+
+    def test_combine_adds_months_and_keeps_first_postcodes(self):
+        january = month_matrix(["AB1 2CD", np.nan, "IJ5 6KL"])
+        february = count_matrix(
+            pd.Series(["P4", "P1"]),
+            pd.Series(["CITALOPRAM", "ZOPICLONE"]),
+            pd.Series([7, 1]),
+        ).select(np.ones(2, dtype=bool), ["MN7 8OP", "QR9 0ST"])
+        combined = combine_matrices([january, february])
+        self.assertEqual(combined.practices.tolist(), ["P1", "P2", "P3", "P4"])
+        self.assertEqual(
+            combined.drugs.tolist(),
+            [MISSING_DRUG, "CITALOPRAM", "SERTRALINE", "ZOPICLONE"],
+        )
+        np.testing.assert_array_equal(
+            combined.counts.toarray(),
+            [[0, 0, 3, 3], [0, 0, 6, 0], [4, 0, 0, 0], [0, 7, 0, 0]],
+        )
+        self.assertEqual(combined.postcodes[0], "AB1 2CD")
+        self.assertTrue(pd.isna(combined.postcodes[1]))
+        self.assertEqual(combined.postcodes[3], "QR9 0ST")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+import numpy as np
+from loneliness.idw import IDWInterpolator, tune_idw_params
+
+# Tests idw.py against brute-force inverse distance weighting and an exhaustive grid search
+# Run from inst/python/ with python -m unittest discover tests
+
+
+def brute_force_idw(points, values, queries, k, power):
+    """
+    Interpolates each query from every distance to the known points: the k nearest weighted by 1/dist**power,
+    or the mean of the known points it coincides with.
+    """
+    predictions = []
+    for query in queries:
+        distances = np.sqrt(((points - query) ** 2).sum(axis=1))
+        nearest = np.argsort(distances, kind="stable")[:k]
+        if (distances[nearest] == 0).any():
+            predictions.append(values[nearest][distances[nearest] == 0].mean())
+        else:
+            weights = 1 / distances[nearest] ** power
+            predictions.append((weights * values[nearest]).sum() / weights.sum())
+    return np.array(predictions)
+
+
+def r2(actual, predicted):
+    """
+    The coefficient of determination, as sklearn's r2_score computes it.
+    """
+    return 1 - ((actual - predicted) ** 2).sum() / ((actual - actual.mean()) ** 2).sum()
+
+
+class IDWInterpolatorTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.points = rng.uniform(0, 1000, size=(400, 2))
+        self.values = rng.normal(size=400)
+        self.queries = rng.uniform(0, 1000, size=(150, 2))
+
+    def test_matches_brute_force(self):
+        for k, power in [(1, 2), (5, 2), (8, 1.5), (12, 0.5)]:
+            model = IDWInterpolator(k, power).fit(self.points, self.values)
+            np.testing.assert_allclose(
+                model.predict(self.queries),
+                brute_force_idw(self.points, self.values, self.queries, k, power),
+                rtol=1e-10,
+            )
+
+    def test_batches_give_the_same_predictions(self):
+        whole = IDWInterpolator().fit(self.points, self.values)
+        batched = IDWInterpolator(batch_size=7).fit(self.points, self.values)
+        np.testing.assert_array_equal(
+            whole.predict(self.queries), batched.predict(self.queries)
+        )
+
+    def test_coincident_points_take_their_mean_value(self):
+        # The first known point appears twice with different values, the second once
+        points = np.vstack([self.points, self.points[:1]])
+        values = np.append(self.values, self.values[0] + 4)
+        queries = np.vstack([self.points[:2], self.queries])
+        model = IDWInterpolator(5).fit(points, values)
+        predictions = model.predict(queries)
+        self.assertAlmostEqual(predictions[0], self.values[0] + 2)
+        self.assertEqual(predictions[1], self.values[1])
+        self.assertTrue(np.isfinite(predictions).all())
+        np.testing.assert_allclose(
+            predictions, brute_force_idw(points, values, queries, 5, 2), rtol=1e-10
+        )
+
+    def test_float32_matches_float64(self):
+        model = IDWInterpolator(dtype="float32").fit(self.points, self.values)
+        predictions = model.predict(np.vstack([self.points[:3], self.queries]))
+        self.assertEqual(predictions.dtype, np.float32)
+        np.testing.assert_allclose(
+            predictions,
+            IDWInterpolator()
+            .fit(self.points, self.values)
+            .predict(np.vstack([self.points[:3], self.queries])),
+            rtol=1e-4,
+            atol=1e-5,
+        )
+
+
+class TuneIDWParamsTest(unittest.TestCase):
+    def test_matches_exhaustive_grid(self):
+        from sklearn.model_selection import KFold
+
+        rng = np.random.default_rng(7)
+        points = rng.uniform(0, 100, size=(300, 2))
+        values = np.sin(points[:, 0] / 15) + np.cos(points[:, 1] / 20)
+        values += rng.normal(scale=0.1, size=300)
+        # Repeat a few points so some test points coincide with training points
+        # Repeats share a value, since the order of tied neighbours differs between k and would change the result
+        points[-10:] = points[:10]
+        values[-10:] = values[:10]
+        n_neighbors = [1, 3, 6, 10]
+        powers = [0.5, 1, 2, 3.5]
+        cv = KFold(n_splits=4, shuffle=True, random_state=0)
+
+        # Fit and score every combination on every fold
+        expected = np.zeros((len(n_neighbors), len(powers)))
+        for train_index, test_index in cv.split(points):
+            for i, k in enumerate(n_neighbors):
+                for j, power in enumerate(powers):
+                    model = IDWInterpolator(k, power).fit(
+                        points[train_index], values[train_index]
+                    )
+                    expected[i, j] += r2(
+                        values[test_index], model.predict(points[test_index])
+                    )
+        expected /= cv.get_n_splits(points)
+
+        best_k, best_power, scores = tune_idw_params(
+            points, values, n_neighbors, powers, cv
+        )
+        np.testing.assert_allclose(scores, expected, rtol=1e-10)
+        best_i, best_j = np.unravel_index(np.argmax(expected), expected.shape)
+        self.assertEqual(best_k, n_neighbors[best_i])
+        self.assertEqual(best_power, powers[best_j])
+
+
+if __name__ == "__main__":
+    unittest.main()
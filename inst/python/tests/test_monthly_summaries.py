@@ -0,0 +1,142 @@
+import os
+import json
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from loneliness.drug_matrix import count_matrix
+from loneliness.monthly_summaries import MANIFEST_NAME, update_monthly_summaries
+
+# Tests the incremental per-month summaries of monthly_summaries.py on small csv months, without the pipeline
+# Run from inst/python/ with python -m unittest discover tests
+
+
+def summarise_csv(file_path, chunksize):
+    """
+    Stands in for preproc.summarise_month(): sums a small practice, description, items csv into a PracticeDrugMatrix.
+    Defined at module level so a process pool can run it.
+    """
+    month = pd.read_csv(file_path)
+    return count_matrix(month["practice"], month["description"], month["items"])
+
+
+def fail(file_path, chunksize):
+    """
+    Stands in for summarise_month() where every month should be read from the store.
+    """
+    raise AssertionError(f"{os.path.basename(file_path)} summarised again")
+
+
+class MonthlySummariesTest(unittest.TestCase):
+    def setUp(self):
+        self.data = tempfile.mkdtemp()
+        self.summary_path = tempfile.mkdtemp()
+        self.files = [self.write_month(month, items=month) for month in (1, 2, 3)]
+        self.summarised = []
+
+    def write_month(self, month, items):
+        file_path = os.path.join(self.data, f"pitc2022{month:02d}.csv")
+        with open(file_path, "w") as month_file:
+            month_file.write(
+                "practice,description,items\n"
+                f"101,SERTRALINE,{items}\n"
+                f"102,SERTRALINE,{items * 2}\n"
+                f"101,ZOPICLONE,{items * 3}\n"
+            )
+        return file_path
+
+    def recording(self, file_path, chunksize):
+        self.summarised.append(os.path.basename(file_path))
+        return summarise_csv(file_path, chunksize)
+
+    def update(self, files=None, summarise=None, **kwargs):
+        return update_monthly_summaries(
+            files or self.files,
+            "scotland",
+            summarise or self.recording,
+            summary_path=self.summary_path,
+            **kwargs,
+        )
+
+    def folder_files(self):
+        return sorted(os.listdir(os.path.join(self.summary_path, "nation=scotland")))
+
+    def manifest(self):
+        with open(
+            os.path.join(self.summary_path, "nation=scotland", MANIFEST_NAME)
+        ) as manifest_file:
+            return json.load(manifest_file)
+
+    def test_new_months_are_summarised_and_returned_in_month_order(self):
+        matrices = self.update(files=self.files[::-1])
+        self.assertEqual(
+            self.summarised, ["pitc202203.csv", "pitc202202.csv", "pitc202201.csv"]
+        )
+        self.assertEqual([int(matrix.counts.sum()) for matrix in matrices], [6, 12, 18])
+        self.assertEqual(sorted(self.manifest()), ["2022-01", "2022-02", "2022-03"])
+
+    def test_unchanged_months_are_read_from_the_store(self):
+        expected = self.update()
+        matrices = self.update(summarise=fail)
+        for matrix, stored in zip(expected, matrices):
+            np.testing.assert_array_equal(
+                matrix.counts.toarray(), stored.counts.toarray()
+            )
+            np.testing.assert_array_equal(matrix.practices, stored.practices)
+            np.testing.assert_array_equal(matrix.drugs, stored.drugs)
+
+    def test_changed_month_is_summarised_again(self):
+        self.update()
+        self.summarised = []
+        self.write_month(2, items=10)
+        matrices = self.update()
+        self.assertEqual(self.summarised, ["pitc202202.csv"])
+        self.assertEqual(int(matrices[1].counts.sum()), 60)
+
+    def test_new_month_is_added_to_stored_months(self):
+        self.update()
+        self.summarised = []
+        matrices = self.update(files=self.files + [self.write_month(4, items=4)])
+        self.assertEqual(self.summarised, ["pitc202204.csv"])
+        self.assertEqual(len(matrices), 4)
+
+    def test_changed_settings_summarise_every_month_again(self):
+        self.update(settings={"read_kwargs": {}})
+        self.summarised = []
+        self.update(settings={"read_kwargs": {"encoding": "ISO-8859-1"}})
+        self.assertEqual(len(self.summarised), 3)
+
+    def test_deleted_summary_is_summarised_again(self):
+        self.update()
+        os.remove(os.path.join(self.summary_path, "nation=scotland", "2022-03.npz"))
+        self.summarised = []
+        self.update()
+        self.assertEqual(self.summarised, ["pitc202203.csv"])
+
+    def test_window_keeps_latest_months_and_evicts_older_ones(self):
+        self.update()
+        self.summarised = []
+        matrices = self.update(
+            files=self.files + [self.write_month(4, items=4)], window=2
+        )
+        self.assertEqual(self.summarised, ["pitc202204.csv"])
+        self.assertEqual([int(matrix.counts.sum()) for matrix in matrices], [18, 24])
+        self.assertEqual(sorted(self.manifest()), ["2022-03", "2022-04"])
+        self.assertEqual(
+            self.folder_files(), ["2022-03.npz", "2022-04.npz", MANIFEST_NAME]
+        )
+
+    def test_workers_give_the_same_summaries(self):
+        serial = self.update()
+        other = tempfile.mkdtemp()
+        parallel = update_monthly_summaries(
+            self.files, "scotland", summarise_csv, workers=2, summary_path=other
+        )
+        for matrix, pooled in zip(serial, parallel):
+            np.testing.assert_array_equal(
+                matrix.counts.toarray(), pooled.counts.toarray()
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
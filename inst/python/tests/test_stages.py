@@ -0,0 +1,191 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from loneliness.stages import StageRunner
+
+# Tests the caching and invalidation of pipeline stages in stages.py on small functions, without the pipeline
+# Run from inst/python/ with python -m unittest discover tests
+
+# Names of the stage functions each run called, in order
+CALLS = []
+
+# What source() returns, standing in for data that changes at its source
+SOURCE = {"rows": 3}
+
+
+def source():
+    """
+    Stands in for a download: returns the current size of the source data.
+    """
+    CALLS.append("source")
+    return dict(SOURCE)
+
+
+def make_frame(size, offset=0, rows=None):
+    """
+    Returns a data frame of size rows, or of rows["rows"] rows when it depends on source().
+    """
+    CALLS.append("make_frame")
+    size = rows["rows"] if rows is not None else size
+    return pd.DataFrame({"value": np.arange(size) + offset})
+
+
+def total(frame):
+    """
+    Sums the value column of an upstream frame, as an array.
+    """
+    CALLS.append("total")
+    return np.array([frame["value"].sum()])
+
+
+def describe(frame, total):
+    """
+    Summarises both upstream outputs as json.
+    """
+    CALLS.append("describe")
+    return {"rows": len(frame), "total": int(total[0])}
+
+
+class StageRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_path = tempfile.mkdtemp()
+        CALLS.clear()
+        SOURCE["rows"] = 3
+
+    def runner(self, size=3, offset=0, depends=None, refresh=False):
+        """
+        A runner of make_frame -> total -> describe, the last also reading make_frame directly.
+        """
+        runner = StageRunner(cache_path=self.cache_path, refresh=refresh)
+        runner.add(
+            "test/make_frame",
+            make_frame,
+            params={"size": size},
+            options={"offset": offset},
+            depends=depends,
+        )
+        runner.add("test/total", total, inputs={"frame": "test/make_frame"})
+        runner.add(
+            "test/describe",
+            describe,
+            inputs={"frame": "test/make_frame", "total": "test/total"},
+        )
+        return runner
+
+    def source_runner(self):
+        """
+        A runner whose make_frame depends on the always run source().
+        """
+        runner = StageRunner(cache_path=self.cache_path)
+        runner.add("test/source", source, always_run=True)
+        runner.add(
+            "test/make_frame",
+            make_frame,
+            inputs={"rows": "test/source"},
+            params={"size": None},
+        )
+        runner.add("test/total", total, inputs={"frame": "test/make_frame"})
+        return runner
+
+    def stage_files(self, stage):
+        return sorted(os.listdir(os.path.join(self.cache_path, "test", stage)))
+
+    def test_unchanged_stages_are_loaded_from_cache(self):
+        expected = self.runner().get("test/describe")
+        self.assertEqual(CALLS, ["make_frame", "total", "describe"])
+        CALLS.clear()
+
+        runner = self.runner()
+        self.assertEqual(runner.get("test/describe"), expected)
+        self.assertEqual(CALLS, [])
+        # Upstream stages of a cached stage are not loaded either
+        self.assertEqual(
+            [record["stage"] for record in runner.metrics.records], ["test/describe"]
+        )
+
+    def test_outputs_are_loaded_in_their_formats(self):
+        self.runner().get("test/describe")
+        CALLS.clear()
+        runner = self.runner()
+        pd.testing.assert_frame_equal(
+            runner.get("test/make_frame"), pd.DataFrame({"value": np.arange(3)})
+        )
+        np.testing.assert_array_equal(runner.get("test/total"), [3])
+        self.assertEqual(runner.get("test/describe"), {"rows": 3, "total": 3})
+        self.assertEqual(CALLS, [])
+
+    def test_changed_params_rerun_the_stage_and_downstream(self):
+        self.runner().get("test/describe")
+        CALLS.clear()
+        output = self.runner(size=4).get("test/describe")
+        self.assertEqual(CALLS, ["make_frame", "total", "describe"])
+        self.assertEqual(output, {"rows": 4, "total": 6})
+
+    def test_changed_depends_rerun_the_stage(self):
+        self.runner(depends={"settings": 1}).get("test/describe")
+        CALLS.clear()
+        self.runner(depends={"settings": 2}).get("test/describe")
+        self.assertEqual(CALLS[0], "make_frame")
+
+    def test_options_do_not_change_the_fingerprint(self):
+        self.runner().get("test/describe")
+        CALLS.clear()
+        self.runner(offset=10).get("test/describe")
+        self.assertEqual(CALLS, [])
+
+    def test_rerun_with_the_same_output_leaves_downstream_cached(self):
+        self.runner().get("test/describe")
+        CALLS.clear()
+        self.runner(refresh={"make_frame"}).get("test/describe")
+        self.assertEqual(CALLS, ["make_frame"])
+
+    def test_refresh_by_full_or_short_name(self):
+        self.runner().get("test/describe")
+        for refresh in [{"test/total"}, {"total"}]:
+            CALLS.clear()
+            self.runner(refresh=refresh).get("test/describe")
+            self.assertEqual(CALLS, ["total"])
+
+    def test_refresh_true_reruns_every_stage(self):
+        self.runner().get("test/describe")
+        CALLS.clear()
+        self.runner(refresh=True).get("test/describe")
+        self.assertEqual(CALLS, ["make_frame", "total", "describe"])
+
+    def test_always_run_stage_reruns_downstream_only_when_its_output_changes(self):
+        self.source_runner().get("test/total")
+        CALLS.clear()
+        self.source_runner().get("test/total")
+        self.assertEqual(CALLS, ["source"])
+
+        CALLS.clear()
+        SOURCE["rows"] = 5
+        output = self.source_runner().get("test/total")
+        self.assertEqual(CALLS, ["source", "make_frame", "total"])
+        np.testing.assert_array_equal(output, [10])
+
+    def test_rewritten_stage_removes_its_earlier_outputs(self):
+        self.runner().get("test/describe")
+        earlier = self.stage_files("make_frame")
+        self.assertEqual(len(earlier), 2)
+
+        runner = self.runner(size=4)
+        runner.get("test/describe")
+        current = runner.fingerprint("test/make_frame")[:16]
+        self.assertEqual(
+            self.stage_files("make_frame"),
+            [f"{current}.meta.json", f"{current}.parquet"],
+        )
+        self.assertEqual(len(self.stage_files("total")), 2)
+        self.assertEqual(len(self.stage_files("describe")), 2)
+
+        # The earlier settings are no longer cached
+        CALLS.clear()
+        self.runner().get("test/describe")
+        self.assertEqual(CALLS, ["make_frame", "total", "describe"])
+
+
+if __name__ == "__main__":
+    unittest.main()
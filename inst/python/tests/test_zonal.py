@@ -0,0 +1,178 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import geopandas as gpd
+import rasterio as rst
+from rasterio.transform import from_origin
+from shapely.geometry import Polygon, box
+from loneliness import zonal
+from loneliness.zonal import label_key, zonal_statistics
+
+# Tests zonal.py against rasterstats zonal_stats, which it replaced, and its cached label rasters
+# Run from inst/python/ with python -m unittest discover tests
+
+STATS = ["count", "min", "max", "mean", "std"]
+
+
+def score_grid():
+    """
+    A 120 x 90 score raster of 10m cells with a patch of NaN cells, and its transform.
+    """
+    rng = np.random.default_rng(3)
+    values = rng.normal(50, 10, size=(120, 90)).astype("float32")
+    values[40:55, 10:30] = np.nan
+    return values, from_origin(1000, 5000, 10, 10)
+
+
+def zone_polygons():
+    """
+    Non-overlapping zones over the grid: squares, a triangle, a zone entirely of NaN cells, a zone smaller than a
+    cell centre spacing, a zone outside the raster and a missing geometry.
+    """
+    return gpd.GeoDataFrame(
+        {"code": ["a", "b", "c", "nan", "tiny", "outside", "missing"]},
+        geometry=[
+            box(1000, 4400, 1450, 5000),
+            box(1450, 4400, 1900, 4700),
+            Polygon([(1000, 3800), (1900, 3800), (1450, 4390)]),
+            box(1120, 4460, 1280, 4590),
+            box(1601, 4751, 1604, 4754),
+            box(9000, 9000, 9500, 9500),
+            None,
+        ],
+        index=[10, 11, 12, 13, 14, 15, 16],
+    )
+
+
+def rasterstats_frame(zones, values, transform):
+    """
+    The stats rasterstats zonal_stats gives each zone with a geometry, as a df like zonal_statistics() returns.
+    """
+    import pandas as pd
+    from rasterstats import zonal_stats
+
+    zones = zones[zones.geometry.notna()]
+    return pd.DataFrame(
+        zonal_stats(
+            zones.geometry,
+            values,
+            affine=transform,
+            stats=STATS,
+            nodata=np.nan,
+        ),
+        index=zones.index,
+    )
+
+
+class ZonalStatisticsTest(unittest.TestCase):
+    def setUp(self):
+        self.values, self.transform = score_grid()
+        self.zones = zone_polygons()
+        self.cache_path = tempfile.mkdtemp()
+
+    def statistics(self, values=None, **kwargs):
+        return zonal_statistics(
+            self.zones,
+            self.values if values is None else values,
+            self.transform,
+            source="zones.geojson",
+            cache_path=kwargs.pop("cache_path", self.cache_path),
+            **kwargs,
+        )
+
+    def test_matches_rasterstats(self):
+        expected = rasterstats_frame(self.zones, self.values, self.transform)
+        stats = self.statistics(cache_path=None).loc[expected.index]
+        np.testing.assert_array_equal(stats["count"], expected["count"])
+        scored = stats["count"] > 0
+        for stat in ["min", "max"]:
+            np.testing.assert_array_equal(
+                stats.loc[scored, stat], expected.loc[scored, stat].astype("float64")
+            )
+        # rasterstats accumulates float32 scores in float32
+        for stat in ["mean", "std"]:
+            np.testing.assert_allclose(
+                stats.loc[scored, stat],
+                expected.loc[scored, stat].astype("float64"),
+                rtol=1e-5,
+            )
+
+    def test_zones_without_scored_cells_have_nan_stats(self):
+        stats = self.statistics()
+        for code in ["nan", "tiny", "outside", "missing"]:
+            zone = stats.loc[self.zones.index[self.zones["code"] == code][0]]
+            self.assertEqual(zone["count"], 0)
+            self.assertTrue(zone[["mean", "min", "max", "std"]].isna().all())
+        self.assertTrue((stats["count"].iloc[:3] > 0).all())
+
+    def test_geotiff_in_strips_matches_array(self):
+        tif_path = os.path.join(tempfile.mkdtemp(), "scores.tif")
+        with rst.open(
+            tif_path,
+            "w",
+            driver="GTiff",
+            height=self.values.shape[0],
+            width=self.values.shape[1],
+            count=1,
+            dtype="float32",
+            transform=self.transform,
+        ) as tif:
+            tif.write(self.values, 1)
+
+        expected = self.statistics(cache_path=None)
+        strip_rows = zonal.STRIP_ROWS
+        zonal.STRIP_ROWS = 7
+        try:
+            stats = zonal_statistics(self.zones, tif_path, cache_path=None)
+        finally:
+            zonal.STRIP_ROWS = strip_rows
+        np.testing.assert_allclose(stats, expected, rtol=1e-12)
+
+    def test_label_raster_is_cached_and_reused(self):
+        expected = self.statistics()
+        label_path = os.path.join(
+            self.cache_path,
+            label_key(self.zones, self.transform, self.values.shape, "zones.geojson")
+            + ".npy",
+        )
+        self.assertEqual(os.listdir(self.cache_path), [os.path.basename(label_path)])
+
+        # Another score surface on the same grid reads the labels back instead of rasterising again
+        rasterize = zonal.features.rasterize
+
+        def fail(*args, **kwargs):
+            raise AssertionError("zones rasterised again")
+
+        zonal.features.rasterize = fail
+        try:
+            reread = self.statistics()
+            shifted = self.statistics(values=self.values + 1)
+        finally:
+            zonal.features.rasterize = rasterize
+        np.testing.assert_array_equal(reread, expected)
+        # Adding 1 to float32 scores rounds them
+        np.testing.assert_allclose(shifted["mean"], expected["mean"] + 1, rtol=1e-7)
+
+    def test_changed_grid_or_zones_rasterise_again(self):
+        self.statistics()
+        key = label_key(self.zones, self.transform, self.values.shape, "zones.geojson")
+        moved = from_origin(1010, 5000, 10, 10)
+        self.assertNotEqual(
+            key, label_key(self.zones, moved, self.values.shape, "zones.geojson")
+        )
+        self.assertNotEqual(
+            key,
+            label_key(
+                self.zones.iloc[:-1],
+                self.transform,
+                self.values.shape,
+                "zones.geojson",
+            ),
+        )
+        zonal_statistics(self.zones, self.values, moved, cache_path=self.cache_path)
+        self.assertEqual(len(os.listdir(self.cache_path)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()